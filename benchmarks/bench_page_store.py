@@ -0,0 +1,72 @@
+# Times the PageStore sorts and topic filtering over a synthetic store of 50k endpoints.
+#
+#   python benchmarks/bench_page_store.py [num_endpoints]
+
+import sys
+import time
+import random
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from indentgen.page_store import PageStore
+
+
+NUM_ENDPOINTS = 50000
+NUM_TAXONOMIES = 300
+
+
+class SyntheticEndpoint:
+    # just the attributes PageStore reads
+    def __init__(self, i, is_taxonomy, taxonomies):
+        self.srp = Path(f'content/page_{i}.dentmark')
+        self.is_taxonomy = is_taxonomy
+        self.taxonomies = taxonomies
+        self.meta_record = {
+            'title': f'Page {random.random()}',
+            'date': None if is_taxonomy or i % 20 == 0 else date(2000, 1, 1) + timedelta(days=random.randrange(9000))
+        }
+        self.meta = self.meta_record
+
+
+def make_store(num_endpoints):
+    random.seed(0)
+    tax_slugs = [f'topics/topic-{i}' for i in range(NUM_TAXONOMIES)]
+    endpoints = []
+    for i in range(num_endpoints):
+        is_taxonomy = i < NUM_TAXONOMIES
+        taxonomies = {slug: None for slug in random.sample(tax_slugs, 3)}
+        endpoints.append(SyntheticEndpoint(i, is_taxonomy, taxonomies))
+    return PageStore(endpoints), tax_slugs
+
+
+def timed(label, func, repeat=1):
+    start = time.perf_counter()
+    for i in range(repeat):
+        result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {elapsed * 1000:>10.1f} ms')
+    return result
+
+
+def main():
+    num_endpoints = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_ENDPOINTS
+    store, tax_slugs = timed(f'build store ({num_endpoints} endpoints)', lambda: make_store(num_endpoints))
+
+    dated = timed('only_dated', store.only_dated)
+    timed('order_by_date (first call)', dated.order_by_date)
+    timed('order_by_date (100 cached calls)', dated.order_by_date, 100)
+    timed('order_by_title (first call)', store.order_by_title)
+    timed('list_view_sort', lambda: store.list_view_sort(tax_slugs[0]))
+    timed(f'filter_by_topic x {len(tax_slugs)}', lambda: [store.filter_by_topic(slug) for slug in tax_slugs])
+
+    topic_stores = [store.filter_by_topic(slug) for slug in tax_slugs]
+    timed(f'list_view_sort x {len(tax_slugs)} topics', lambda: [s.list_view_sort(slug) for s, slug in zip(topic_stores, tax_slugs)])
+
+    dated.add(SyntheticEndpoint(num_endpoints + 1, False, {}))
+    timed('order_by_date (after add)', dated.order_by_date)
+
+
+if __name__ == '__main__':
+    main()
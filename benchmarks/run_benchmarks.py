@@ -0,0 +1,172 @@
+# Builds a synthetic site (see synthetic_site.py) and times:
+#   cold_build     building with no _wisdom or publish directory
+#   image_resize   the image copying/resizing part of the cold build
+#   warm_build     building again with everything cached
+#   generate_only  calling generate() again on the warm Indentgen instance
+#   edit_rebuild   an incremental build after appending a paragraph to one page
+#
+# Results are written as json to benchmarks/results/ (or --output) along with the site options, indentgen version
+# and git revision. Pass --compare with an earlier results file to see how each number changed.
+#
+#   python benchmarks/run_benchmarks.py [--pages N] [--jobs N] [--repeat N] [--compare results/xxx.json] ...
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARKS_PATH = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_PATH.parent))
+
+from indentgen import Indentgen, log
+from synthetic_site import SyntheticSite, add_arguments, get_options
+
+
+RESULTS_PATH = BENCHMARKS_PATH / 'results'
+EDITED_PAGE = Path('content') / 'pages' / 'page-1.dentmark'
+
+
+class BenchmarkRunner:
+
+    def __init__(self, site_path, jobs=None):
+        self.site_path = Path(site_path).resolve() # absolute, the builds run from inside it
+        self.jobs = jobs
+
+
+    def _read_phases(self):
+        with open(self.site_path / Indentgen.PROFILE_FILE) as f:
+            report = json.load(f)
+        return {phase['name']: phase['seconds'] for phase in report['phases']}
+
+
+    def _build(self, incremental=False):
+        start = time.perf_counter()
+        indentgen = Indentgen(self.site_path, self.jobs, profile=True)
+        init_seconds = time.perf_counter() - start
+        indentgen.generate(incremental)
+        seconds = time.perf_counter() - start
+
+        result = {
+            'seconds': seconds,
+            'init_seconds': init_seconds,
+            'generate_seconds': seconds - init_seconds,
+            'phases': self._read_phases()
+        }
+        return indentgen, result
+
+
+    def run(self):
+        results = {}
+
+        for dir_name in (Indentgen.WISDOM_DIR, Indentgen.OUTPUT_DIR):
+            shutil.rmtree(self.site_path / dir_name, ignore_errors=True)
+
+        indentgen, results['cold_build'] = self._build()
+        indentgen.wisdom.close()
+        results['image_resize'] = {'seconds': results['cold_build']['phases']['generate: copy images']}
+
+        indentgen, results['warm_build'] = self._build()
+
+        start = time.perf_counter()
+        indentgen.generate()
+        results['generate_only'] = {'seconds': time.perf_counter() - start}
+        indentgen.wisdom.close()
+
+        edited_path = self.site_path / EDITED_PAGE
+        original = edited_path.read_text()
+        try:
+            edited_path.write_text(f'{original}p:\n    an edit to time the rebuild\n')
+            indentgen, results['edit_rebuild'] = self._build(incremental=True)
+            indentgen.wisdom.close()
+        finally:
+            edited_path.write_text(original)
+
+        return results
+
+
+def get_git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_PATH, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_indentgen_version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        return version('indentgen')
+    except (ImportError, PackageNotFoundError):
+        return None
+
+
+def print_results(results, compare_results=None):
+    for name, result in results.items():
+        line = f"  {name:<16} {result['seconds']:>10.3f}s"
+        if compare_results is not None and name in compare_results:
+            old_seconds = compare_results[name]['seconds']
+            line += f"  was {old_seconds:>10.3f}s ({result['seconds'] / old_seconds:.2f}x)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument('--site-dir', help='Where to generate the site. A temporary directory is used if omitted')
+    parser.add_argument('--jobs', type=int, help='Passed on to Indentgen')
+    parser.add_argument('--repeat', type=int, default=1, help='Run everything this many times and keep the fastest of each')
+    parser.add_argument('--output', help='Results file. Defaults to benchmarks/results/<timestamp>.json')
+    parser.add_argument('--compare', help='An earlier results file to compare against')
+    parser.add_argument('--verbose', action='store_true', help="Log the builds' progress and reports")
+    args = parser.parse_args()
+
+    log.configure('info' if args.verbose else 'warning')
+
+    options = get_options(args)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        site_path = Path(args.site_dir) if args.site_dir else Path(tmp_dir) / 'site'
+        print(f'Generating site in {site_path}')
+        SyntheticSite(site_path, **options).generate()
+
+        runner = BenchmarkRunner(site_path, args.jobs)
+        results = {}
+        for i in range(args.repeat):
+            for name, result in runner.run().items():
+                if name not in results or result['seconds'] < results[name]['seconds']:
+                    results[name] = result
+
+    compare_results = None
+    if args.compare:
+        with open(args.compare) as f:
+            compare_results = json.load(f)['results']
+
+    print_results(results, compare_results)
+
+    timestamp = datetime.now()
+    output_path = Path(args.output) if args.output else RESULTS_PATH / f"{timestamp.strftime('%Y%m%d-%H%M%S')}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump({
+            'timestamp': timestamp.isoformat(),
+            'indentgen_version': get_indentgen_version(),
+            'git_revision': get_git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'jobs': args.jobs,
+            'repeat': args.repeat,
+            'options': options,
+            'results': results
+        }, f, indent=2)
+    print(f'Results written to {output_path}')
+
+
+if __name__ == '__main__':
+    main()
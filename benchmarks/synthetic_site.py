@@ -0,0 +1,331 @@
+# Generates a synthetic Indentgen site of a configurable size to benchmark against.
+#
+#   python benchmarks/synthetic_site.py SITE_DIR [--pages N] [--taxonomy-depth N] [--taxonomy-breadth N] ...
+#
+# The site has:
+#   - a taxonomy tree under topics/ that is taxonomy_depth levels deep with taxonomy_breadth children per level
+#   - pages pages, each tagged with a couple of random leaf topics and linking to pk_links other pages by pk
+#   - subsites subsites of subsite_pages pages each, hung off the first pages
+#   - galleries gallery pages under the photos taxonomy (a gallery taxonomy), with gallery_images images each
+#   - an image on every 10th page
+#   - minimal templates that list pages, so pagination and listings are exercised as well
+#
+# The same arguments and seed always generate the same site.
+
+import random
+import shutil
+import argparse
+from datetime import date, timedelta
+from pathlib import Path
+
+from PIL import Image
+
+
+DEFAULTS = {
+    'pages': 500,
+    'taxonomy_depth': 2,
+    'taxonomy_breadth': 5,
+    'subsites': 2,
+    'subsite_pages': 20,
+    'galleries': 5,
+    'gallery_images': 10,
+    'pk_links': 3,
+    'per_page': 25,
+    'image_size': (1600, 1200),
+    'seed': 0
+}
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+    'magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo consequat'
+).split()
+
+PARAGRAPHS_PER_PAGE = 5
+IMAGE_EVERY_N_PAGES = 10
+SHARED_IMAGES = 10
+
+TEMPLATES = {
+    'pages/home.html': '''<html><head><title>${config.get('title', '')}</title></head><body>
+% if page.paginator_page is not None:
+<ul>
+% for item in page.paginator_page.items:
+<li><a href="${item.url}">${item.title or item.url}</a></li>
+% endfor
+</ul>
+% endif
+</body></html>
+''',
+    'pages/content.html': '''<html><head><title>${page.meta.get('title', '')}</title></head><body>
+<h1>${page.meta.get('title', '')}</h1>
+${page.content}
+% if page.paginator_page is not None:
+% for item in page.paginator_page.items:
+<a href="${item.url}">${item.url}</a>
+% endfor
+% endif
+</body></html>
+''',
+    'pages/taxonomy.html': '''<html><head><title>${page.meta.get('title', '')}</title></head><body>
+<h1>${page.meta.get('title', '')}</h1>
+% if page.paginator_page is not None:
+<ul>
+% for item in page.paginator_page.items:
+<li><a href="${item.url}">${item.title or item.url}</a></li>
+% endfor
+</ul>
+% endif
+</body></html>
+''',
+    'pages/gallery_item.html': '''<html><body>
+<img src="${page.indentgen.wisdom.get_image_url_by_key(page.srp, 800, 600)[1]}" />
+% if page.prev is not None:
+<a href="${page.prev.url}">prev</a>
+% endif
+% if page.next is not None:
+<a href="${page.next.url}">next</a>
+% endif
+</body></html>
+''',
+    'pages/date_archive.html': '''<html><head><title>${page.title}</title></head><body>
+% if page.paginator_page is not None:
+% for item in page.paginator_page.items:
+<a href="${item.url}">${item.url}</a>
+% endfor
+% endif
+</body></html>
+''',
+    'pages/redirect.html': '''<html><head><meta http-equiv="refresh" content="0; url=${page.to_endpoint.url}" /></head></html>
+''',
+    '404.html': '''<html><body>Not found</body></html>
+''',
+    'index.xml': '''<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0"><channel><title>${config.get('title', '')}</title></channel></rss>
+''',
+    'sitemap.xml': '''<?xml version="1.0" encoding="utf-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+% for url, endpoint in page.indentgen.routes.items():
+% if endpoint.add_to_sitemap:
+<url><loc>${url}</loc></url>
+% endif
+% endfor
+</urlset>
+'''
+}
+
+
+class SyntheticSite:
+
+    def __init__(self, site_path, **options):
+        self.site_path = Path(site_path)
+        self.options = {**DEFAULTS, **options}
+        self.random = random.Random(self.options['seed'])
+        self.next_pk = 1
+        self.pks = []
+        self.leaf_topics = []
+
+
+    def generate(self):
+        # only ever remove a directory this generated, in case the wrong path was passed in
+        if self.site_path.exists():
+            if not (self.site_path / 'config.dentmark').exists():
+                raise Exception(f'{self.site_path} exists and is not a site, refusing to overwrite it')
+            shutil.rmtree(self.site_path)
+
+        self._write_config()
+        self._write_theme()
+        self._write_taxonomies()
+        self._write_shared_images()
+
+        options = self.options
+        pages_dir = self.site_path / 'content' / 'pages'
+        for i in range(options['pages']):
+            self._write_page(pages_dir, f'page-{i}', with_image=i % IMAGE_EVERY_N_PAGES == 0)
+
+        for i in range(options['subsites']):
+            self._write_subsite(i)
+
+        for i in range(options['galleries']):
+            self._write_gallery(i)
+
+        return self.site_path
+
+
+    def _write(self, srp, text):
+        path = self.site_path / srp
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+    def _write_image(self, srp):
+        path = self.site_path / srp
+        path.parent.mkdir(parents=True, exist_ok=True)
+        color = tuple(self.random.randrange(256) for i in range(3))
+        Image.new('RGB', self.options['image_size'], color).save(path)
+
+
+    def _write_config(self):
+        self._write('config.dentmark', '\n'.join((
+            'title: Synthetic site',
+            'description: A generated site for benchmarking',
+            'date_archive_url: archive',
+            f"per_page: {self.options['per_page']}",
+            ''
+        )))
+
+
+    def _write_theme(self):
+        for name, template in TEMPLATES.items():
+            self._write(Path('theme') / 'templates' / name, template)
+        self._write(Path('theme') / 'static' / 'css' / 'style.css', 'body { margin: 0 auto; max-width: 50em; }\n')
+
+
+    def _write_taxonomy(self, slug_path, title, gallery=False):
+        lines = ['meta:', f'    slug_path: {slug_path}', f'    title: {title}']
+        if gallery:
+            lines.append('    gallery: true')
+        self._write(Path('taxonomy') / f'{slug_path}.dentmark', '\n'.join(lines) + '\n')
+
+
+    def _write_taxonomies(self):
+        options = self.options
+
+        self._write_taxonomy('topics', 'Topics')
+        level = ['topics']
+        for depth in range(options['taxonomy_depth']):
+            next_level = []
+            for parent in level:
+                for i in range(options['taxonomy_breadth']):
+                    slug_path = f'{parent}/{parent.rsplit("/", 1)[-1]}-{i}' if depth else f'{parent}/t-{i}'
+                    self._write_taxonomy(slug_path, f'Topic {slug_path}')
+                    next_level.append(slug_path)
+            level = next_level
+        self.leaf_topics = level
+
+        self._write_taxonomy('photos', 'Photos', gallery=True)
+
+
+    def _write_shared_images(self):
+        for i in range(SHARED_IMAGES):
+            self._write_image(Path('content') / 'images' / f'shared-{i}.png')
+
+
+    def _get_taxonomy_lines(self, slug_paths):
+        # slug paths are nested in meta.taxonomy, i.e. topics/t-0/t-0-1 is topics: t-0: t-0-1:
+        tree = {}
+        for slug_path in slug_paths:
+            node = tree
+            for component in slug_path.split('/'):
+                node = node.setdefault(component, {})
+
+        lines = ['    taxonomy:']
+        def walk(node, indent):
+            for name, children in node.items():
+                lines.append(f"{'    ' * indent}{name}:")
+                walk(children, indent + 1)
+        walk(tree, 2)
+        return lines
+
+
+    def _get_text(self, num_words):
+        return ' '.join(self.random.choice(WORDS) for i in range(num_words))
+
+
+    def _get_meta_lines(self, slug, taxonomies):
+        pk = self.next_pk
+        self.next_pk += 1
+        self.pks.append(pk)
+
+        day = date(2010, 1, 1) + timedelta(days=self.random.randrange(4000))
+        return pk, [
+            'meta:',
+            f'    title: {slug.replace("-", " ").title()}',
+            f'    slug: {slug}',
+            f'    pk: {pk}',
+            f'    date: {day.isoformat()}',
+            f'    description: {self._get_text(12)}',
+            f'    summary: {self._get_text(30)}',
+            *self._get_taxonomy_lines(taxonomies)
+        ]
+
+
+    def _write_page(self, content_dir, slug, with_image=False):
+        topics = self.random.sample(self.leaf_topics, min(2, len(self.leaf_topics)))
+        pk, lines = self._get_meta_lines(slug, topics)
+
+        link_pks = [linked for linked in self.pks[:-1]]
+        self.random.shuffle(link_pks)
+
+        for i in range(PARAGRAPHS_PER_PAGE):
+            lines.append('p:')
+            lines.append(f'    {self._get_text(60)}')
+            if i < len(link_pks) and i < self.options['pk_links']:
+                lines.append(f'    a: a link to {link_pks[i]}')
+                lines.append(f'        url: {link_pks[i]}')
+                lines.append(f'    {self._get_text(10)}')
+
+        if with_image:
+            # pages are always one directory below content/
+            lines.append(f'img: ../images/shared-{pk % SHARED_IMAGES}.png')
+            lines.append(f'    alt: {self._get_text(4)}')
+
+        self._write(content_dir.relative_to(self.site_path) / f'{slug}.dentmark', '\n'.join(lines) + '\n')
+
+
+    def _write_subsite(self, i):
+        subsite_slug = f'sub-{i}'
+        content_dir = self.site_path / 'content' / subsite_slug
+
+        self._write(content_dir.relative_to(self.site_path) / 'config.dentmark', '\n'.join((
+            f'title: Subsite {i}',
+            f'parent_slug: page-{i}',
+            f'subsite_slug: {subsite_slug}',
+            f"per_page: {self.options['per_page']}",
+            ''
+        )))
+
+        for j in range(self.options['subsite_pages']):
+            self._write_page(content_dir, f'{subsite_slug}-page-{j}')
+
+
+    def _write_gallery(self, i):
+        # a gallery is made of every image under its page's directory, so each one gets its own
+        slug = f'gallery-{i}'
+        gallery_dir = Path('content') / 'galleries' / slug
+        pk, lines = self._get_meta_lines(slug, ['photos'])
+
+        lines.append('    gallery:')
+        lines.append(f"        per_page: {self.options['per_page']}")
+        for j in range(self.options['gallery_images']):
+            self._write_image(gallery_dir / f'img-{j}.png')
+            lines.append(f'        img: img-{j}.png')
+
+        self._write(gallery_dir / f'{slug}.dentmark', '\n'.join(lines) + '\n')
+
+
+def add_arguments(parser):
+    for name, default in DEFAULTS.items():
+        if name == 'image_size':
+            parser.add_argument('--image-size', type=int, nargs=2, default=default, metavar=('WIDTH', 'HEIGHT'))
+        else:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+
+
+def get_options(args):
+    options = {name: getattr(args, name) for name in DEFAULTS}
+    options['image_size'] = tuple(options['image_size'])
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('site_dir', help='Directory to generate the site in. Replaced if it is a previously generated site')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    site_path = SyntheticSite(args.site_dir, **get_options(args)).generate()
+    print(f'Generated site in {site_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import logging
+from collections import OrderedDict
+
+from indentgen.workers import can_fork, get_process_pool, get_chunksize, render_page
+from indentgen.log import Progress
+
+logger = logging.getLogger(__name__)
+
+
+class ContentIndex:
+    # Globs and stats every .dentmark source under content/ and taxonomy/ once per build.
+    # Each srp gets a single record that the later Indentgen phases read from, rather
+    # than re-walking the tree and re-loading the cached render from wisdom every pass.
+    #
+    # record: {'srp': srp, 'is_taxonomy': bool, 'stat': os.stat_result, 'meta': meta record or None, 'info': render info or None,
+    #          'root': root or None, 'rendered': bool}
+    #
+    # 'meta' is the compact meta record from Wisdom.get_meta, which is all the passes before rendering need.
+    # 'info' is the title, description and summary from Wisdom.get_render_info, which is all listing pages need.
+    # 'root' is only set once the page has been fully rendered (or its render loaded from wisdom), along with 'rendered'.
+    #
+    # Rendered bodies are read from wisdom lazily, the first time a page's content is used, and the most recently
+    # used BODY_CACHE_SIZE of them are kept so listing pages don't re-read the same cached html over and over.
+
+    BODY_CACHE_SIZE = 256
+
+    def __init__(self, indentgen_inst):
+        self.indentgen = indentgen_inst
+        self.wisdom = indentgen_inst.wisdom
+        self.records = {}
+        self.subsite_config_srps = []
+        self.bodies = OrderedDict() # srp: rendered html, least recently used first
+
+
+    # previous_index is the ContentIndex of the last scan when rescanning after a change. The meta records of
+    # sources whose stat is unchanged are carried over from it rather than looked up in wisdom again
+    def scan(self, previous_index=None):
+        site_path = self.indentgen.site_path
+        config_file_name = self.indentgen.CONFIG_FILE_NAME
+
+        for is_taxonomy, use_path in ((True, self.indentgen.taxonomy_path), (False, self.indentgen.content_path)):
+            for f in use_path.glob('**/*.dentmark'):
+                srp = f.relative_to(site_path)
+
+                # subsite config files live alongside content, but are not pages
+                if srp.name == config_file_name:
+                    if not is_taxonomy:
+                        self.subsite_config_srps.append(srp)
+                    continue
+
+                stat = f.stat()
+
+                meta = None
+                previous = previous_index.records.get(srp) if previous_index is not None else None
+                if previous is not None and (previous['stat'].st_mtime_ns, previous['stat'].st_size) == (stat.st_mtime_ns, stat.st_size):
+                    meta = previous['meta']
+
+                self.records[srp] = {
+                    'srp': srp,
+                    'is_taxonomy': is_taxonomy,
+                    'stat': stat,
+                    'meta': meta,
+                    'info': None,
+                    'root': None,
+                    'rendered': False
+                }
+
+
+    def gen_records(self, is_taxonomy=False):
+        for record in self.records.values():
+            if record['is_taxonomy'] == is_taxonomy:
+                yield record
+
+
+    def get_meta(self, srp):
+        record = self.records[srp]
+
+        if record['meta'] is None:
+            record['meta'] = self.wisdom.get_meta(srp, record['is_taxonomy'], record['stat'])
+
+        return record['meta']
+
+
+    def get_info(self, srp):
+        record = self.records[srp]
+
+        if record['info'] is None:
+            if not record['rendered']:
+                record['info'] = self.wisdom.get_render_info(srp, record['stat'])
+            if record['info'] is None: # rendered by this instance, or stale and needs rendering
+                record['info'] = self.wisdom.make_render_info(self.get_root(srp))
+
+        return record['info']
+
+
+    def get_root(self, srp):
+        record = self.records[srp]
+
+        if not record['rendered']:
+            rendered, root = self.wisdom.get_rendered(srp, record['is_taxonomy'], False, record['stat'], load_body=False)
+            record['root'] = root
+            record['rendered'] = True
+
+            if rendered: # only set if it had to be rendered, the cached html isn't read until it's needed
+                self._cache_body(srp, rendered)
+
+        return record['root']
+
+
+    def get_body(self, srp):
+        rendered = self.bodies.get(srp)
+        if rendered is not None:
+            self.bodies.move_to_end(srp)
+            return rendered
+
+        record = self.records[srp]
+        rendered, root = self.wisdom.get_rendered(srp, record['is_taxonomy'], False, record['stat'])
+        record['root'] = root
+        record['rendered'] = True
+
+        self._cache_body(srp, rendered)
+        return rendered
+
+
+    def _cache_body(self, srp, rendered):
+        self.bodies[srp] = rendered
+        self.bodies.move_to_end(srp)
+        if len(self.bodies) > self.BODY_CACHE_SIZE:
+            self.bodies.popitem(last=False)
+
+
+    def render_stale(self, jobs):
+        # fully render the content and taxonomy pages that miss the render cache across a pool of worker
+        # processes. Meant to be called once the pk/slug maps are complete, since page bodies
+        # only depend on those and not on each other. Taxonomies are included because anything left stale
+        # here would be rendered by the (detached) route workers, which can't send their render cache back
+        if not can_fork():
+            logger.warning("Rendering serially: --jobs requires the 'fork' multiprocessing start method")
+            return
+
+        stale = []
+        for record in self.records.values():
+            if not record['rendered'] and not self.wisdom.is_render_fresh(record['srp'], record['stat']):
+                stale.append(record)
+
+        if not stale:
+            return
+
+        srps = [record['srp'] for record in stale]
+        stats = [record['stat'] for record in stale]
+        is_taxonomies = [record['is_taxonomy'] for record in stale]
+
+        progress = Progress(logger, 'Rendered', 'pages', len(srps))
+
+        with get_process_pool(self.indentgen, jobs) as pool:
+            for srp, render_meta, root, image_log, profile_log in pool.map(render_page, srps, stats, is_taxonomies, chunksize=get_chunksize(len(srps), jobs)):
+                self.wisdom.merge_rendered(srp, render_meta, root, image_log)
+                if profile_log is not None:
+                    self.indentgen.profiler.merge_worker_log(profile_log)
+                record = self.records[srp]
+                record['info'] = render_meta['info']
+                record['root'] = root
+                record['rendered'] = True
+                progress.advance()
+
+        progress.finish()
+
+        self.wisdom.save()
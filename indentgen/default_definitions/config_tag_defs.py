@@ -1,5 +1,5 @@
 import re
-from dentmark import defs_manager, TagDef, PosIntTagDef, OptionalUnique, RequiredUnique
+from dentmark import defs_manager, TagDef, PosIntTagDef, BoolTagDef, OptionalUnique, RequiredUnique
 
 CONFIG_TAG_SET_NAME = 'indentgen_config'
 SUBSITE_CONFIG_TAG_SET_NAME = 'indentgen_subsite_config'
@@ -103,3 +103,82 @@ class SubsiteConfigTemplatePathPrefix(TagDef):
     max_num_text_nodes = 1
 
     parents = [OptionalUnique('root')]
+
+
+# image output options are site wide, so these are registered after the subsite tag set is copied
+
+@config_tag_set.register()
+class ConfigImageFormat(TagDef):
+    tag_name = 'image_format'
+    is_context = True
+
+    min_num_text_nodes = 1
+    max_num_text_nodes = 1
+
+    parents = [OptionalUnique('root')]
+
+    formats = ('png', 'jpeg', 'webp', 'keep')
+
+    def validate(self):
+        val = self.get_data()
+        if val not in self.formats:
+            return f"Tag '{self.tag_name}' must be one of: {', '.join(self.formats)}"
+
+
+@config_tag_set.register()
+class ConfigImageQuality(PosIntTagDef):
+    tag_name = 'image_quality'
+
+    parents = [OptionalUnique('root')]
+
+
+# images that are already within the size limit are published as they are, in their own format
+@config_tag_set.register()
+class ConfigImagePassthrough(BoolTagDef):
+    tag_name = 'image_passthrough'
+
+    parents = [OptionalUnique('root')]
+
+
+# srcset is opt-in. When image_srcset_widths is set, content images get a smaller version for each width in srcset
+# along with sizes and their intrinsic width/height. One width per line:
+#   image_srcset_widths:
+#       320
+#       640
+@config_tag_set.register()
+class ConfigImageSrcsetWidths(TagDef):
+    tag_name = 'image_srcset_widths'
+    is_context = True
+
+    min_num_text_nodes = 1
+
+    parents = [OptionalUnique('root')]
+
+    def process_data(self, data):
+        return [int(x) if x.strip().isdigit() else x for x in data]
+
+    def validate(self):
+        for val in self.get_data():
+            if not isinstance(val, int) or val < 1:
+                return f"Tag '{self.tag_name}' must list positive integer widths, got '{val}'"
+
+
+# the sizes attribute to go with image_srcset_widths. Defaults to the full width up to the images' max width
+@config_tag_set.register()
+class ConfigImageSrcsetSizes(TagDef):
+    tag_name = 'image_srcset_sizes'
+    is_context = True
+
+    min_num_text_nodes = 1
+    max_num_text_nodes = 1
+
+    parents = [OptionalUnique('root')]
+
+
+# publish .gz (and .br, when brotli is installed) variants of the text files next to them, for servers that can send
+# precompressed files as they are (indentgen serve does)
+@config_tag_set.register()
+class ConfigPrecompress(BoolTagDef):
+    tag_name = 'precompress'
+
+    parents = [OptionalUnique('root')]
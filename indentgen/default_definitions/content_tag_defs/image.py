@@ -15,6 +15,24 @@ class IndentgenContentImage(Image):
         lto = self.context.get('link_to_original', False)
         return wisdom.get_image_url(srp, self.content, self.MAX_WIDTH, self.MAX_HEIGHT, copy_original=lto)
 
+    def get_srcset_attrs(self, resized_serve_path):
+        # srcset, sizes, width and height, only when image_srcset_widths is set in the site config
+        wisdom = self.extra_context['indentgen'].wisdom
+        if wisdom.image_srcset is None:
+            return ''
+
+        widths, sizes = wisdom.image_srcset
+        srp = self.extra_context['srp']
+        width, height, srcset = wisdom.get_image_srcset(srp, self.content, widths, self.MAX_WIDTH, self.MAX_HEIGHT)
+
+        use_srcset = ''
+        if srcset:
+            srcset_candidates = ', '.join(f'{serve_path} {w}w' for serve_path, w in srcset + [(resized_serve_path, width)])
+            use_sizes = sizes or f'(max-width: {self.MAX_WIDTH}px) 100vw, {self.MAX_WIDTH}px'
+            use_srcset = f' srcset="{srcset_candidates}" sizes="{use_sizes}"'
+
+        return f'{use_srcset} width="{width}" height="{height}"'
+
     def render_main(self):
         key, resized_serve_path, original_serve_path = self.get_image_data()
 
@@ -24,7 +42,7 @@ class IndentgenContentImage(Image):
         use_alt_text = alt or ' '.join(caption)
         use_alt = f' alt="{use_alt_text}"' if use_alt_text else ''
 
-        img_src = f'<img src="{resized_serve_path}"{use_alt} />'
+        img_src = f'<img src="{resized_serve_path}"{self.get_srcset_attrs(resized_serve_path)}{use_alt} />'
 
         lto = self.context.get('link_to_original', False)
 
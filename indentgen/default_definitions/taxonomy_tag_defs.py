@@ -9,23 +9,28 @@ TAXONOMY_TAG_SET_NAME = 'indentgen_taxonomy'
 taxonomy_tag_set = defs_manager.copy_tag_set(TAXONOMY_TAG_SET_NAME)
 
 
-@taxonomy_tag_set.register(replace=True)
-class IndentgenTaxonomyRoot(Root):
+def add_parent_taxonomy(meta):
+    # a taxonomy is implicitly tagged with its parent. Also called by Wisdom.get_meta, since meta-only parses
+    # don't run before_render
+    taxonomies = meta.get('taxonomy', {})
+    slug_path = meta['slug_path']
 
-    def before_render(self):
-        meta = self.context['meta']
-        taxonomies = meta.get('taxonomy', {})
-        slug_path = meta['slug_path']
+    slug_path_components = slug_path.split('/')
+    parent_slug_path = '/'.join(slug_path_components[:-1])
+
+    if parent_slug_path and parent_slug_path not in taxonomies:
+        taxonomies = meta.setdefault('taxonomy', {})
+        taxonomies[parent_slug_path] = None
 
-        slug_path_components = slug_path.split('/')
-        parent_slug_path = '/'.join(slug_path_components[:-1])
+    if slug_path in taxonomies:
+        return f"Cannot list self as a taxonomy: '{slug_path}'"
 
-        if parent_slug_path and parent_slug_path not in taxonomies:
-            taxonomies = meta.setdefault('taxonomy', {})
-            taxonomies[parent_slug_path] = None
 
-        if slug_path in taxonomies:
-            return f"Cannot list self as a taxonomy: '{tax_slug_path}'"
+@taxonomy_tag_set.register(replace=True)
+class IndentgenTaxonomyRoot(Root):
+
+    def before_render(self):
+        return add_parent_taxonomy(self.context['meta'])
 
 
 @taxonomy_tag_set.register()
@@ -1,50 +1,61 @@
+import sys
+import time
+import logging
+
 from indentgen.page_store import PageStore
 from calendar import month_name
 from pathlib import Path
 
 PAGE_URL = 'page' #TODO make this configurable in site settings?
 
+logger = logging.getLogger(__name__)
+
+
+def make_url(url_components, page=None):
+    # interned, the same url string is shared by the endpoint, the route table and the publish manifest
+    if not url_components and not page:
+        return '/'
+    url = '/'.join(url_components)
+    if page is not None and page > 0:
+        url += f'/{PAGE_URL}/{page + 1}'
+    # all routes except home are xxx/xxx and need to
+    # have the '/' added at he beginning and end.
+    # Paginated homepage URLS are just /page/xx
+    # and so will have //page/xx if this check is
+    # not in place. Also prepends / to /404.html,
+    # /sitemap.xml etc.
+    prepend_slash = '/' if url[0] != '/' else ''
+    append_slash = '/' if not (len(url_components) == 1 and '.' in url) else '' # don't append if 404.html, sitemap.xml etc.
+    return sys.intern(f"{prepend_slash}{url}{append_slash}")
+
+
 class Endpoint:
+    # There's an endpoint for every page, listing page and gallery photo, so they're kept small: __slots__ rather
+    # than a __dict__ (every subclass has to declare its own, even if empty) and the url is worked out once
     use_template = 'pages/home.html'
     srp = None
     is_taxonomy = False
     add_to_sitemap = True
     is_gallery = False
 
+    __slots__ = ('url_components', 'page', 'indentgen', 'subsite_config', 'child_pages', 'paginator_page', '_url')
+
     def __init__(self, indentgen_obj, url_components, page=None, subsite_config=None):
-        self.url_components = url_components
+        self.url_components = tuple(url_components)
         self.page = page
         self.indentgen = indentgen_obj
         self.subsite_config = subsite_config
         self.child_pages = None
         self.paginator_page = None
+        self._url = make_url(self.url_components, page)
 
 
     def get_output_path(self):
-        if self.page is None or self.page == 0:
-            return Path(*self.url_components)
-        else:
-            components = list(self.url_components) # components could be tuples
-            components.append(PAGE_URL)
-            components.append(str(self.page + 1))
-            return Path(*components)
+        return Path(self._url.strip('/')) # the url without its slashes, i.e. xxx/page/2 or 404.html. Path('') is '.'
 
     @property
     def url(self):
-        if not self.url_components and not self.page:
-            return '/'
-        url = '/'.join(self.url_components)
-        if self.page is not None and self.page > 0:
-            url += f'/{PAGE_URL}/{self.page + 1}'
-        # all routes except home are xxx/xxx and need to
-        # have the '/' added at he beginning and end.
-        # Paginated homepage URLS are just /page/xx
-        # and so will have //page/xx if this check is
-        # not in place. Also prepends / to /404.html,
-        # /sitemap.xml etc.
-        prepend_slash = '/' if url[0] != '/' else ''
-        append_slash = '/' if not (len(self.url_components) == 1 and '.' in url) else '' # don't append if 404.html, sitemap.xml etc.
-        return f"{prepend_slash}{url}{append_slash}"
+        return self._url
 
     @property
     def identifier(self):
@@ -56,9 +67,17 @@ class Endpoint:
     def meta(self):
         return {} # for compatibility with templates rather that having to do hasattr checks
 
+    @property
+    def meta_record(self):
+        return self.meta
+
+    @property
+    def manifest(self):
+        return [] # files published alongside this route, see ContentEndpoint
+
 
     def render(self):
-        print('rendering', self.url)
+        logger.debug('Rendering %s', self.url) # not formatted unless debug logging is on, this runs for every route
         context = {
             'page': self,
             'config': self.subsite_config or self.indentgen.config
@@ -71,17 +90,31 @@ class Endpoint:
                 use_template = f'{template_path_prefix}/{self.use_template}'
 
         template = self.indentgen.templates.get_template(use_template)
-        return template.render(**context)
+
+        profiler = self.indentgen.profiler
+        if profiler is None:
+            return template.render(**context)
+
+        start = time.perf_counter()
+        rendered = template.render(**context)
+        profiler.add_template(use_template, time.perf_counter() - start)
+        return rendered
+
+
+    def get_page(self, page): # 0 indexed
+        page_ep = Endpoint(self.indentgen, self.url_components, page, self.subsite_config)
+        page_ep.child_pages = self.child_pages
+        return page_ep
 
 
     def next_page(self):
-        next_ep = Endpoint(self.indentgen, self.url_components, self.page + 1, self.subsite_config)
-        next_ep.child_pages = self.child_pages
-        return next_ep
+        return self.get_page(self.page + 1)
 
 
 class ContentEndpoint(Endpoint):
-    use_template = 'pages/content.html'
+    default_template = 'pages/content.html'
+
+    __slots__ = ('srp', 'prev', 'next', '_use_template')
 
     def __init__(self, indentgen_obj, url_components, page, srp, subsite_config=None):
         super().__init__(indentgen_obj, url_components, page, subsite_config)
@@ -90,21 +123,22 @@ class ContentEndpoint(Endpoint):
         self.next = None
 
         # change the template if use_template is set in meta
-        use_template = self.meta.get('use_template')
-        if use_template:
-            self.use_template = use_template
+        self._use_template = self.meta_record['use_template']
+
+    @property
+    def use_template(self):
+        return self._use_template or self.default_template
 
-    #TODO perhaps optimize this so it doesn't read from cached wisdom .html files if only fetching root
     def get_rendered(self):
-        return self.indentgen.wisdom.get_rendered(self.srp, self.is_taxonomy)
+        return self.content, self.root
 
     @property
     def root(self):
-        return self.get_rendered()[1]
+        return self.indentgen.content_index.get_root(self.srp)
 
     @property
     def content(self):
-        return self.get_rendered()[0]
+        return self.indentgen.content_index.get_body(self.srp)
 
     @property
     def context(self):
@@ -114,53 +148,63 @@ class ContentEndpoint(Endpoint):
     def meta(self):
         return self.context['meta']
 
+    @property
+    def meta_record(self):
+        # the compact meta from Wisdom.get_meta. Enough for sorting and filtering without loading the rendered page
+        return self.indentgen.content_index.get_meta(self.srp)
+
+    @property
+    def manifest(self):
+        # read from the meta record rather than meta so that writing the output never loads or renders the page
+        return self.meta_record.get('manifest', [])
+
+    @property
+    def render_info(self):
+        # title, description and summary, without loading the rendered page when it's cached. Review pages derive
+        # their title and description while rendering, so these can't come from the meta record
+        return self.indentgen.content_index.get_info(self.srp)
+
     @property
     def summary(self):
-        meta_summary = self.root.context['meta'].get('summary_content', '')
-        if meta_summary:
-            return meta_summary
-        else:
-            inline_summary_list = self.root.collectors.get('sum', [])
-            if inline_summary_list:
-                return ''.join(inline_summary_list)
-        return ''
+        return self.render_info['summary']
 
     @property
     def taxonomies(self):
-        return self.meta.get('taxonomy', {})
+        return self.meta_record['taxonomy']
 
     @property
     def title(self):
-        return self.meta.get('title', '')
+        return self.render_info['title']
 
     @property
     def description(self):
-        return self.meta.get('description', '')
+        return self.render_info['description']
 
     @property
     def slug(self):
-        return self.meta['slug']
+        return self.meta_record['slug']
 
     @property
     def is_gallery(self):
         return self.paginator_page is not None
 
     def get_taxonomy_group(self, top_level_taxonomy):
-        #TODO maybe cache this in indentgen so we're not having to re-filter these over and over for every hit
-        filter_page_taxonomies = [k for k,v in self.indentgen.taxonomy_map.items() if v['top_level'] == top_level_taxonomy]
-        taxonomies_for_page =  set(filter_page_taxonomies).intersection(self.taxonomies)
-        return PageStore([self.indentgen.taxonomy_map[slug]['endpoint'] for slug in taxonomies_for_page])
+        # only look at this page's own taxonomies rather than filtering the whole taxonomy map
+        taxonomy_tree = self.indentgen.taxonomy_tree
+        return PageStore([self.indentgen.taxonomy_map[slug]['endpoint'] for slug in self.taxonomies if taxonomy_tree.get_top_level(slug) == top_level_taxonomy])
 
-    def next_page(self):
-        next_ep = ContentEndpoint(self.indentgen, self.url_components, self.page + 1, self.srp, self.subsite_config)
-        next_ep.child_pages = self.child_pages
-        return next_ep
+    def get_page(self, page):
+        page_ep = ContentEndpoint(self.indentgen, self.url_components, page, self.srp, self.subsite_config)
+        page_ep.child_pages = self.child_pages
+        return page_ep
 
 
 class ContentGalleryEndpoint(Endpoint):
     use_template = 'pages/gallery_item.html'
     add_to_sitemap = False
 
+    __slots__ = ('srp', 'photo_data', 'gallery_endpoint', 'prev', 'next')
+
     def __init__(self, indentgen_obj, url_components, srp, photo_data, gallery_endpoint): #TODO photogalleries in subsites?
         super().__init__(indentgen_obj, url_components, None, None)
         self.srp = srp # srp of image
@@ -169,39 +213,37 @@ class ContentGalleryEndpoint(Endpoint):
         self.prev = None
         self.next = None
 
-    def next_page(self):
+    def get_page(self, page):
         return None # this class does not have paginated pages, so this method should never be called
 
 
 class TaxonomyEndpoint(ContentEndpoint):
-    use_template = 'pages/taxonomy.html'
+    default_template = 'pages/taxonomy.html'
     is_taxonomy = True
     is_gallery = False
 
+    __slots__ = ()
+
     @property
     def breadcrumbs(self):
-        path_titles = []
-        focused = self.indentgen.taxonomy_map[self.slug]
-        while 'parent' in focused:
-            focused = self.indentgen.taxonomy_map[focused['parent']]
-            path_titles.append({'title': focused['title'], 'url': focused['endpoint'].url})
-        path_titles.reverse()
-        return path_titles
+        return self.indentgen.taxonomy_tree.get_breadcrumbs(self.slug)
 
     @property
     def slug(self):
-        return self.meta['slug_path']
+        return self.meta_record['slug_path']
 
-    def next_page(self):
-        next_ep = TaxonomyEndpoint(self.indentgen, self.url_components, self.page + 1, self.srp, self.subsite_config)
-        next_ep.child_pages = self.child_pages
-        return next_ep
+    def get_page(self, page):
+        page_ep = TaxonomyEndpoint(self.indentgen, self.url_components, page, self.srp, self.subsite_config)
+        page_ep.child_pages = self.child_pages
+        return page_ep
 
 
 class RedirectEndpoint(Endpoint):
     use_template = 'pages/redirect.html'
     add_to_sitemap = False
 
+    __slots__ = ('to_endpoint',)
+
     def __init__(self, indentgen_obj, from_url_components, to_endpoint):
         super().__init__(indentgen_obj, from_url_components, None)
         self.to_endpoint = to_endpoint
@@ -210,32 +252,40 @@ class RedirectEndpoint(Endpoint):
     def identifier(self):
         return self.to_endpoint.identifier
 
-    def next_page(self):
+    def get_page(self, page):
         return None # this class does not have paginated pages, so this method should never be called
 
 
 class StaticServeEndpoint(Endpoint):
+    # static files and resized images aren't kept as endpoints, RouteTable.add_static stores just their url and
+    # makes one of these when the url is looked up
     use_template = None
     add_to_sitemap = False
 
+    __slots__ = ()
+
     def __init__(self, indentgen_obj, url_components):
         super().__init__(indentgen_obj, url_components, None)
 
     def render(self):
         return None
 
-    def next_page(self):
+    def get_page(self, page):
         return None # this class does not have paginated pages, so this method should never be called
 
 
 class CachedImgEndpoint(StaticServeEndpoint):
     add_to_sitemap = False
 
+    __slots__ = ()
+
 
 class DateArchiveEndpoint(Endpoint):
     use_template = 'pages/date_archive.html'
     add_to_sitemap = False
 
+    __slots__ = ()
+
     @property
     def title(self):
         if len(self.url_components) == 1:
@@ -271,6 +321,8 @@ class Http404Endpoint(Endpoint):
     use_template = '404.html'
     add_to_sitemap = False
 
+    __slots__ = ()
+
     def __init__(self, indentgen_obj):
         super().__init__(indentgen_obj, ['404.html'])
 
@@ -279,6 +331,8 @@ class RssEndpoint(Endpoint):
     use_template = 'index.xml'
     add_to_sitemap = False
 
+    __slots__ = ()
+
     def __init__(self, indentgen_obj):
         super().__init__(indentgen_obj, ['index.xml'])
 
@@ -287,6 +341,8 @@ class SiteMapEndpoint(Endpoint):
     use_template = 'sitemap.xml'
     add_to_sitemap = False
 
+    __slots__ = ()
+
     def __init__(self, indentgen_obj):
         super().__init__(indentgen_obj, ['sitemap.xml'])
 
@@ -1,11 +1,61 @@
+import math
+import shutil
+
 from PIL import Image
 
-def resize(abs_path_in, abs_path_out, max_width, max_height):
+def get_image_size(abs_path):
+    # only reads the header, the image isn't decoded
+    with Image.open(abs_path) as im:
+        return im.size
+
+
+def get_resized_size(width, height, max_width, max_height):
+    # the size Image.thumbnail() produces, so pages can declare an image's size without decoding it
+    if width <= max_width and height <= max_height:
+        return width, height
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if max_width / max_height >= aspect:
+        return round_aspect(max_height * aspect, key=lambda n: abs(aspect - n / max_height)), max_height
+    return max_width, round_aspect(max_width / aspect, key=lambda n: 0 if n == 0 else abs(aspect - max_width / n))
+
+
+def resize(abs_path_in, abs_path_out, max_width, max_height, image_format='PNG', quality=None, passthrough=False):
+    resize_versions(abs_path_in, [(abs_path_out, max_width, max_height, image_format, quality, passthrough)])
+
+
+def resize_versions(abs_path_in, versions):
+    # versions: [(abs_path_out, max_width, max_height, image_format, quality, passthrough)]
+    # the source is only decoded once, however many versions of it are made
     with Image.open(abs_path_in) as im:
-        if im.width > max_width or im.height > max_height:
-            im.thumbnail((max_width, max_height))
+        for abs_path_out, max_width, max_height, image_format, quality, passthrough in versions:
+            abs_path_out.parent.mkdir(parents=True, exist_ok=True)
+
+            fits = im.width <= max_width and im.height <= max_height
+
+            # gifs are never re-encoded so that animations are kept. With passthrough, images that are already small
+            # enough are copied as is rather than being decoded and re-encoded. Their versions keep the source's
+            # format, unless the file isn't what its extension says
+            if image_format == 'GIF' or (passthrough and fits and im.format == image_format):
+                shutil.copyfile(abs_path_in, abs_path_out)
+                continue
+
+            version = im.copy()
+
+            if not fits:
+                version.thumbnail((max_width, max_height))
+
+            options = {}
 
-        abs_path_out.parent.mkdir(parents=True, exist_ok=True)
-        im.save(abs_path_out, "PNG")
+            if image_format == 'JPEG':
+                if version.mode not in ('RGB', 'L'):
+                    version = version.convert('RGB') # no alpha channel in jpeg
+                options['optimize'] = True
 
+            if quality is not None:
+                options['quality'] = quality
 
+            version.save(abs_path_out, image_format, **options)
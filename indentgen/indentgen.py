@@ -1,9 +1,13 @@
 #TODO enforce that series must have part #s
 
 import sys
-import shutil
+import time
+import logging
 import importlib
+import threading
+import contextlib
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import dentmark
 
@@ -11,12 +15,20 @@ from mako.template import Template
 from mako.lookup import TemplateLookup
 
 from indentgen.wisdom import Wisdom
+from indentgen.content_index import ContentIndex
+from indentgen.publisher import Publisher
+from indentgen.workers import can_fork, get_process_pool, get_chunksize, render_route
 from indentgen.path_dict import PathDict
+from indentgen.taxonomy_tree import TaxonomyTree
 from indentgen.default_definitions import content_tag_set, taxonomy_tag_set
 from indentgen.taxonomy_def_set import TaxonomyDefSet
-from indentgen.endpoints import PAGE_URL, Endpoint, ContentEndpoint, ContentGalleryEndpoint, TaxonomyEndpoint, RedirectEndpoint, StaticServeEndpoint, CachedImgEndpoint, DateArchiveEndpoint, Http404Endpoint, RssEndpoint, SiteMapEndpoint
-from indentgen.paginator import Paginator
+from indentgen.endpoints import Endpoint, ContentEndpoint, ContentGalleryEndpoint, TaxonomyEndpoint, RedirectEndpoint, StaticServeEndpoint, CachedImgEndpoint, DateArchiveEndpoint, Http404Endpoint, RssEndpoint, SiteMapEndpoint
+from indentgen.route_table import RouteTable
 from indentgen.page_store import PageStore
+from indentgen.profiler import Profiler
+from indentgen.log import Progress
+
+logger = logging.getLogger(__name__)
 
 
 class Indentgen:
@@ -41,15 +53,24 @@ class Indentgen:
     DEFAULT_PER_PAGE = 25
     DEFAULT_PER_PAGE_GALLERY = 50
 
-    def __init__(self, site_path):
+    WRITER_THREADS = 4
+    PENDING_WRITES_PER_JOB = 8 # bounds how many rendered pages can be held in memory waiting to be written
+
+    PROFILE_FILE = Path(WISDOM_DIR) / 'profile.json'
+
+    def __init__(self, site_path, jobs=None, profile=False):
         self.site_path = Path(site_path)
+        self.jobs = jobs # number of worker processes to use. None renders serially
+        self.profiler = Profiler() if profile else None
 
-        sys.path.append(str(self.site_path))
+        # the defs module is only imported once per process, so there's no need to add the site again
+        if str(self.site_path) not in sys.path:
+            sys.path.append(str(self.site_path))
 
         try:
             self.defs_module = importlib.import_module(self.CUSTOM_DEFS_MODULE_NAME)
         except ModuleNotFoundError:
-            print('No custom definitions found') #TODO better error or warning here?
+            logger.info('No custom definitions found') #TODO better error or warning here?
 
         self.content_path = self.site_path / self.CONTENT_DIR
         self.taxonomy_path = self.site_path / self.TAXONOMY_DIR
@@ -68,61 +89,107 @@ class Indentgen:
         self.templates = TemplateLookup(directories=[template_dir], module_directory=template_cache_dir)
 
         self.wisdom = Wisdom(self)
-        self.config = self.wisdom.get_config()
 
-        self.routes = {}
+        self._patch_def_sets()
+
+        self._build()
+
+
+    # Re-reads the sources after a change, keeping the wisdom connection, templates and custom defs (changes to those
+    # need a restart anyway). The meta of sources that haven't changed since the last scan is carried over, everything
+    # else (routes, page stores, url tables) is built again from scratch. Used by the watcher.
+    def refresh(self):
+        self.wisdom.reset_stats()
+        self._build(self.content_index)
+
+
+    def _build(self, previous_index=None):
+        with self._profile('config'):
+            self.config = self.wisdom.get_config()
+            self.wisdom.set_image_policy(self.config)
+
+        # glob and stat all of the content and taxonomy sources once. Every phase below reads from this
+        self.content_index = ContentIndex(self)
+        with self._profile('scan'):
+            self.content_index.scan(previous_index)
+
+        self.routes = RouteTable(self)
 
         self.pk_link_map = {}
         self.slug_map = {}
-        self.subsite_data = PathDict()
 
-        self._patch_def_sets()
+        # set by _build_url_table once all slugs are known
+        self.slug_url_components = None
+        self.pk_url_map = None
+        self.subsite_data = PathDict()
 
-        self._build_taxonomy_map()
-        self._check_taxonomy_tags_meta(is_taxonomy=True)
+        with self._profile('taxonomy_map'):
+            self._build_taxonomy_map()
+            self._check_taxonomy_tags_meta(is_taxonomy=True)
 
-        self._find_subsite_srps()
+        with self._profile('subsites'):
+            self._find_subsite_srps()
+        self.wisdom.save() # wisdom changes are committed in batches at the end of each phase
 
         # do a pass of the content parsing only the meta to build the PK map so that
         # all pks are known prior to rendering the full page content
-        self._pre_populate_meta_pk()
+        with self._profile('pre_populate_meta_pk'):
+            self._pre_populate_meta_pk()
 
-        self._validate_subsite_slugs()
+        with self._profile('url_table'):
+            self._validate_subsite_slugs()
+            self._build_url_table()
 
-        self._build_page_store()
+        # all pks and slugs are known now, so the page bodies can be rendered independently of each other
+        if self.jobs:
+            with self._profile('render_stale'):
+                self.content_index.render_stale(self.jobs)
+
+        with self._profile('page_store'):
+            self._build_page_store()
+        self.wisdom.save()
 
         self._check_taxonomy_tags_meta(is_taxonomy=False)
 
-        self._generate_taxonomy_pagination_routes()
-        self._generate_date_archive_routes()
-        self._generate_home_pagination_routes()
+        with self._profile('taxonomy_pagination_routes'):
+            self._generate_taxonomy_pagination_routes()
+        with self._profile('date_archive_routes'):
+            self._generate_date_archive_routes()
+        with self._profile('home_pagination_routes'):
+            self._generate_home_pagination_routes()
 
         self._generate_404_route()
         self._generate_rss_route()
         self._generate_sitemap_route()
 
-        self._build_static_file_remapping()
-        self._build_resized_img_endpoints()
+        with self._profile('static_file_remapping'):
+            self._build_static_file_remapping()
+        with self._profile('resized_img_endpoints'):
+            self._build_resized_img_endpoints()
+        self.wisdom.save()
 
 
-    def _gen_walk_content(self, is_taxonomy=False, meta_only=False):
-        use_path = self.taxonomy_path if is_taxonomy else self.content_path
-        for f in use_path.glob('**/*.dentmark'):
-            srp = f.relative_to(self.site_path)
+    def _profile(self, phase_name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(phase_name)
 
-            # skip over subsite config
-            if srp.name == self.CONFIG_FILE_NAME:
-                continue
 
-            rendered, root = self.wisdom.get_rendered(srp, is_taxonomy, meta_only)
-            yield srp, rendered, root
+    def _gen_walk_content(self, is_taxonomy=False):
+        for record in self.content_index.gen_records(is_taxonomy):
+            srp = record['srp']
+            root = self.content_index.get_root(srp)
+            yield srp, root
+
+
+    def _gen_walk_meta(self, is_taxonomy=False):
+        for record in self.content_index.gen_records(is_taxonomy):
+            srp = record['srp']
+            yield srp, self.content_index.get_meta(srp)
 
 
     def _add_route(self, endpoint):
-        collision_endpoint = self.routes.get(endpoint.url)
-        if collision_endpoint is not None:
-            raise Exception(f"URL conflict for '{endpoint.url}': {endpoint.identifier} and {collision_endpoint.identifier}")
-        self.routes[endpoint.url] = endpoint
+        self.routes.add(endpoint)
 
 
     def _patch_def_sets(self):
@@ -139,17 +206,15 @@ class Indentgen:
         tax_map = {}
         top_level_taxonomies = []
 
-        for srp, rendered, root in self._gen_walk_content(is_taxonomy=True):
-            meta = root.context['meta']
-
+        for srp, meta in self._gen_walk_meta(is_taxonomy=True):
             slug_path = meta['slug_path']
             collision = tax_map.get(slug_path)
             if collision:
                 raise Exception(f"Taxonomy slugs conflict: {srp} and {collision['srp']}")
 
             tax_map[slug_path] = {'slug_path': slug_path, 'srp': srp, 'title': meta['title']}
-            tax_map[slug_path]['pseudo'] = meta['pseudo'] if 'pseudo' in meta else False
-            tax_map[slug_path]['gallery'] = meta['gallery'] if 'gallery' in meta else False
+            tax_map[slug_path]['pseudo'] = meta['pseudo'] or False
+            tax_map[slug_path]['gallery'] = meta['gallery'] or False
 
             slug_path_components = slug_path.split('/')
 
@@ -188,13 +253,13 @@ class Indentgen:
 
         self.taxonomy_map = tax_map
         self.top_level_taxonomies = top_level_taxonomies
+        self.taxonomy_tree = TaxonomyTree(tax_map)
 
 
     def _check_taxonomy_tags_meta(self, is_taxonomy):
-        for srp, rendered, root in self._gen_walk_content(is_taxonomy):
-            meta = root.context['meta']
-            taxonomy = meta.get('taxonomy')
-            if taxonomy is not None:
+        for srp, meta in self._gen_walk_meta(is_taxonomy):
+            taxonomy = meta['taxonomy']
+            if taxonomy:
                 invalid = set(taxonomy).difference(self.taxonomy_map)
                 if invalid:
                     raise Exception(f"Invalid taxonomy tag(s) {invalid} in meta: {srp}")
@@ -202,9 +267,7 @@ class Indentgen:
 
     # locate other config files in content dir so that we can handle subsites correctly
     def _find_subsite_srps(self):
-        use_path = self.content_path
-        for f in use_path.glob(f'**/{self.CONFIG_FILE_NAME}'):
-            srp = f.relative_to(self.site_path)
+        for srp in self.content_index.subsite_config_srps:
             subsite_dir = srp.parent
 
             subsite_config = self.wisdom.get_subsite_config(subsite_dir)
@@ -215,9 +278,13 @@ class Indentgen:
     # first pass is to resolve all of the pks in the meta, so that they are available
     # when rendering the full body. This is needed to reslove link url's that are PKs in the dentmark
     def _pre_populate_meta_pk(self):
-        for srp, rendered, root in self._gen_walk_content(is_taxonomy=False, meta_only=True):
+        num_pages = sum(1 for record in self.content_index.gen_records(is_taxonomy=False))
+        progress = Progress(logger, 'Read meta of', 'pages', num_pages) # parsed, or loaded from the meta_cache
 
-            slug = root.context['meta']['slug']
+        for srp, meta in self._gen_walk_meta(is_taxonomy=False):
+            progress.advance()
+
+            slug = meta['slug']
 
             conflicting_slug_srp = None
 
@@ -232,7 +299,7 @@ class Indentgen:
             if conflicting_slug_srp:
                 raise Exception(f"Slugs conflict. Both are '{slug}'. Must be unique: {srp} and {conflicting_slug_srp}")
 
-            pk = root.context['meta'].get('pk')
+            pk = meta['pk']
 
             #TODO make this configurable in setting whether to use pk shortcuts or not
             url = f'{pk}-{slug}' if pk is not None else slug
@@ -242,6 +309,8 @@ class Indentgen:
             if pk:
                 self.pk_link_map[pk] = slug
 
+        progress.finish()
+
 
     def _validate_subsite_slugs(self):
         # now that we have ALL page slugs stored in self.slug_map, validate that the subsite slugs and parents make sense
@@ -261,7 +330,24 @@ class Indentgen:
             self.slug_map[slug] = {'slug': slug, 'srp': config_srp, 'last_url_part': slug, 'subsite_data': subsite_data}
 
 
+    def _build_url_table(self):
+        # resolve every slug and pk to its url once, rather than walking the subsite parent chain for every link
+        self.slug_url_components = {slug: self._walk_url_components(slug) for slug in self.slug_map}
+
+        pk_url_map = {}
+        for pk, slug in self.pk_link_map.items():
+            url = '/'.join(self.slug_url_components[slug])
+            pk_url_map[pk] = f'/{url}/' # add leading/trailing slashes to make it an absolute link
+        self.pk_url_map = pk_url_map
+
+
     def _resolve_url_components(self, slug):
+        if self.slug_url_components is not None:
+            return list(self.slug_url_components[slug]) # copy, callers build on these
+        return self._walk_url_components(slug)
+
+
+    def _walk_url_components(self, slug):
         slug_data = self.slug_map[slug]
         components = [slug_data['last_url_part']]
 
@@ -292,11 +378,11 @@ class Indentgen:
 
         child_pages = PageStore()
         image_srps = []
-        search_dir = srp.parent
+        search_dir = self.site_path / srp.parent # srp is site relative, not cwd relative
         for f in search_dir.glob(f'**/*.*'):
             for ext in self.GALLERY_IMAGE_EXTENSIONS:
                 if ext.lower() == f.suffix.lower():
-                    image_srps.append(f)
+                    image_srps.append(f.relative_to(self.site_path))
                     break
         image_srps.sort()
 
@@ -330,9 +416,7 @@ class Indentgen:
     def _build_page_store(self):
         page_store = PageStore()
         non_pk_page_store = PageStore()
-        for srp, rendered, root in self._gen_walk_content(is_taxonomy=False):
-            meta = root.context['meta']
-
+        for srp, meta in self._gen_walk_meta(is_taxonomy=False):
             slug = meta['slug']
             url_components = self._resolve_url_components(slug)
 
@@ -343,7 +427,7 @@ class Indentgen:
 
             #TODO DRY violation with content_tag_defs
             has_gallery = False
-            for tax_slug_path in meta.get('taxonomy', {}):
+            for tax_slug_path in meta['taxonomy']:
                 try:
                     has_gallery = self.taxonomy_map[tax_slug_path]['gallery']
                 except KeyError:
@@ -353,7 +437,8 @@ class Indentgen:
                     break
 
             if has_gallery:
-                gallery_ctx = meta.get('gallery', {})
+                # the image keys in the gallery context are resolved while rendering, so this needs the full root
+                gallery_ctx = self.content_index.get_root(srp).context['meta'].get('gallery', {})
 
                 endpoint = self._get_content_gallery_endpoint(gallery_ctx, url_components, srp, subsite_config)
             else:
@@ -361,7 +446,7 @@ class Indentgen:
                 endpoint = ContentEndpoint(self, url_components, None, srp, subsite_config)
                 self._add_route(endpoint)
 
-            pk = meta.get('pk')
+            pk = meta['pk']
 
             use_page_store = page_store
             use_non_pk_page_store = non_pk_page_store
@@ -397,65 +482,49 @@ class Indentgen:
 
 
     def _make_paginated_routes(self, base_endpoint, per_page=None):
-        url_components = base_endpoint.url_components
-
-        base_redirect = RedirectEndpoint(self, url_components + [PAGE_URL] + ['1'], base_endpoint) # 2021/3/page/1 -> 2021/3/
-        self._add_route(base_redirect)
-
-        page_redirect = RedirectEndpoint(self, url_components + [PAGE_URL], base_endpoint) # 2021/3/page -> 2021/3/
-        self._add_route(page_redirect)
-
-        #TODO this paginator stuff is a mess. clean it up. The PageStore should probably generate the paginator,
-        # not all of this attaching the paginator to the endpoint crap. Plus violating DRY doing this in about 3 places
-
+        # 2021/3/page/1 -> 2021/3/ and 2021/3/page -> 2021/3/ redirects and the pages after the first are implied by
+        # the range the route table keeps, see RouteTable.add_paginated
         if per_page is None:
             per_page = self.config.get('per_page', self.DEFAULT_PER_PAGE)
 
-        pag = Paginator(base_endpoint.child_pages, per_page)
-
-        for endpoint in pag.gen_all_pages(base_endpoint):
-            self._add_route(endpoint)
-
-
-    def _has_deep_children(self, tax_slug):
-        children_stack = [tax_slug]
-        while children_stack:
-            focused = self.taxonomy_map[children_stack.pop()]
-            has_children = len(focused['endpoint'].child_pages.exclude_taxonomies()) > 0
-            if has_children:
-                return True
-
-            children_stack.extend(focused.get('children', []))
-        return False
+        self.routes.add_paginated(base_endpoint, per_page)
 
 
     def _generate_taxonomy_pagination_routes(self):
         per_page = self.config.get('per_page', self.DEFAULT_PER_PAGE)
 
-        all_taxonomy_endpoints = PageStore([info['endpoint'] for info in self.taxonomy_map.values()])
-        all_endpoints = self.page_store + self.non_pk_page_store + all_taxonomy_endpoints
+        # collect into one store rather than concatenating copies
+        all_endpoints = PageStore()
+        all_endpoints.extend(self.page_store)
+        all_endpoints.extend(self.non_pk_page_store)
+        all_endpoints.extend(info['endpoint'] for info in self.taxonomy_map.values())
 
         # add the subsite pages to all_endpoints
         for subsite_data in self.subsite_data:
             subsite_page_store = subsite_data.get('page_store')
             if subsite_page_store:
-                all_endpoints += subsite_page_store
+                all_endpoints.extend(subsite_page_store)
 
             non_pk_page_store = subsite_data.get('non_pk_page_store')
             if non_pk_page_store:
-                all_endpoints += non_pk_page_store
+                all_endpoints.extend(non_pk_page_store)
+
+        self.all_endpoints = all_endpoints
 
-        # first pass to gather all of the child pages for each taxonomy
+        # first pass to gather all of the child pages for each taxonomy. filter_by_topic is served
+        # from the store's topic index, which is built once on the first call
         for slug, info in self.taxonomy_map.items():
             info['endpoint'].child_pages = all_endpoints.filter_by_topic(slug)
 
+        self.taxonomy_tree.count_pages()
+
         for slug, info in self.taxonomy_map.items():
             endpoint_0 = info['endpoint']
 
             # remove the taxonomy children that do not have at least 1 page in their children chain
             #eligible_child_tax_endpoints = []
             for child_slug in info.get('children', []):
-                if not self._has_deep_children(child_slug):
+                if not self.taxonomy_tree.has_deep_children(child_slug):
                     child_endpoint = self.taxonomy_map[child_slug]['endpoint']
                     endpoint_0.child_pages.remove(child_endpoint)
 
@@ -513,20 +582,9 @@ class Indentgen:
 
     def _generate_home_pagination_routes_helper(self, per_page, page_store, prefix_components, subsite_config=None):
         endpoint_home_0 = Endpoint(self, prefix_components, 0, subsite_config)
+        endpoint_home_0.child_pages = page_store.recent()
 
-        child_pages = page_store.recent()
-        pag = Paginator(child_pages, per_page)
-
-        endpoint_home_0.child_pages = child_pages # attach this in addition to paginator, for completeness although home probably won't need it
-
-        base_redirect = RedirectEndpoint(self, prefix_components + [PAGE_URL] + ['1'], endpoint_home_0) # /page/1 -> /
-        self._add_route(base_redirect)
-
-        page_redirect = RedirectEndpoint(self, prefix_components + [PAGE_URL], endpoint_home_0) # /page -> /
-        self._add_route(page_redirect)
-
-        for endpoint in pag.gen_all_pages(endpoint_home_0):
-            self._add_route(endpoint)
+        self._make_paginated_routes(endpoint_home_0, per_page) # /page/1 -> /, /page -> /, /page/2 ...
 
 
     def _generate_home_pagination_routes(self):
@@ -582,8 +640,7 @@ class Indentgen:
             static_file_mapping[srp] = {'from': f, 'to': move_to, 'srp': use_srp}
 
             components = [self.STATIC_URL] + list(use_srp.parts)
-            endpoint = StaticServeEndpoint(self, components)
-            self._add_route(endpoint)
+            self.routes.add_static(StaticServeEndpoint, components)
 
         self.static_file_mapping = static_file_mapping
 
@@ -593,34 +650,41 @@ class Indentgen:
         return f'/{self.STATIC_URL}/{use_srp}'
 
 
-    def _copy_static(self):
+    def _copy_static(self, publisher):
         for meta in self.static_file_mapping.values():
-            meta['to'].parent.mkdir(parents=True, exist_ok=True)
-            shutil.copyfile(meta['from'], meta['to'])
+            publisher.copy_file(meta['from'], meta['to'])
 
 
     def _build_resized_img_endpoints(self):
         for img_data in self.wisdom.gen_cached_images():
             components = img_data['serve_path'].parts[1:] # drop leading '/'
-            endpoint = CachedImgEndpoint(self, components)
-            self._add_route(endpoint)
+            self.routes.add_static(CachedImgEndpoint, components)
 
             if img_data['copy_original']:
                 components = img_data['original_serve_path'].parts[1:] # drop leading '/'
-                endpoint = CachedImgEndpoint(self, components)
-                self._add_route(endpoint)
+                self.routes.add_static(CachedImgEndpoint, components)
 
 
-    def _copy_cached_imgs(self):
-        for img_data in self.wisdom.gen_cached_images(build=True):
-            publish_path = img_data['publish_path']
-            publish_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copyfile(img_data['cached_path'], publish_path)
+    def _copy_cached_imgs(self, publisher):
+        for img_data in self.wisdom.gen_cached_images(build=True, jobs=self.jobs):
+            publisher.copy_file(img_data['cached_path'], img_data['publish_path'])
 
             if img_data['copy_original']:
-                publish_path = img_data['original_publish_path']
-                publish_path.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copyfile(img_data['original_path'], publish_path)
+                publisher.copy_file(img_data['original_path'], img_data['original_publish_path'])
+
+
+    def filter_by_topic(self, slug): # helper for templates, all pages (including subsite pages and taxonomies) with the taxonomy
+        return self.all_endpoints.filter_by_topic(slug)
+
+
+    def get_endpoints_for_urls(self, urls): # for link checking. {url: endpoint or None if nothing is served at url}
+        endpoints = {}
+        for url in urls:
+            endpoint = self.routes.get(url)
+            if endpoint is None and not url.endswith('/'):
+                endpoint = self.routes.get(f'{url}/') # tolerate a missing trailing slash
+            endpoints[url] = endpoint
+        return endpoints
 
 
     def get_image_url(self, srp_key, max_width, max_height): # helper/convienence relay method
@@ -628,45 +692,162 @@ class Indentgen:
 
 
     def get_url_for_pk(self, pk): # used in TagDefs to dynimacially resolve URLS to pages
-        slug = self.pk_link_map[int(pk)]
-        url_components = self._resolve_url_components(slug)
-        url = '/'.join(url_components)
-        return f'/{url}/' # add leading/trailing slashes to make it an absolute link
+        if self.pk_url_map is not None:
+            url = self.pk_url_map[int(pk)] # raises KeyError for unknown pks, same as below
+        else:
+            slug = self.pk_link_map[int(pk)]
+            url_components = self._resolve_url_components(slug)
+            url = '/'.join(url_components)
+            url = f'/{url}/' # add leading/trailing slashes to make it an absolute link
+
+        # the page being rendered has to be re-rendered if this url changes
+        self.wisdom.add_dependency('pk_urls', int(pk), url)
+        return url
+
+
+    def get_output_file(self, endpoint):
+        endpoint_output_path = endpoint.get_output_path()
+        if endpoint_output_path.suffix:
+            return self.output_path / endpoint_output_path.name # 404.html, sitemap.xml etc.
+        return self.output_path / endpoint_output_path / 'index.html'
+
+
+    # only file io, this runs on the writer threads when generating in parallel. Anything that needs the endpoint
+    # (and so possibly wisdom) is worked out by the caller on the main thread
+    def _write_output(self, publisher, output_file, rendered, manifest):
+        if output_file.suffix == '.xml':
+            rendered = rendered.lstrip() # strip leading whitespace from xml files to avoid XML parsing error
 
+        publisher.write_text(output_file, rendered)
 
-    def generate(self):
-        # remove old/stale published content
-        shutil.rmtree(self.output_path, ignore_errors=True) # if dir doesn't exist, ignore error
+        # copy any files listed in meta.manifest
+        for srp in manifest:
+            from_path = self.site_path / srp
+            to_path = output_file.parent / srp.name
+            publisher.copy_file(from_path, to_path)
 
-        for endpoint in self.routes.values():
-            #print('rendering', endpoint.url_components, endpoint.url, endpoint.identifier, endpoint.get_output_path())
+
+    def _generate_serial(self, publisher, timings, urls=None):
+        endpoints = self.routes.values() if urls is None else [self.routes[url] for url in urls]
+        progress = Progress(logger, 'Rendered', 'routes', len(endpoints))
+
+        for endpoint in endpoints:
+            progress.advance()
+            start = time.perf_counter()
             rendered = endpoint.render()
             if rendered is None:
                 continue
+            self._add_timing(timings, endpoint, time.perf_counter() - start)
+
+            self._write_output(publisher, self.get_output_file(endpoint), rendered, endpoint.manifest)
+
+        progress.finish()
+
+
+    def _generate_parallel(self, publisher, timings):
+        # templates are rendered in forked worker processes, the results are written out by a bounded pool of
+        # writer threads. Static and cached image endpoints don't render anything so they are skipped here
+        urls = list(self.routes.gen_urls_excluding(StaticServeEndpoint))
+
+        max_pending_writes = threading.BoundedSemaphore(self.jobs * self.PENDING_WRITES_PER_JOB)
+        progress = Progress(logger, 'Rendered', 'routes', len(urls))
+
+        def write(output_file, rendered, manifest):
+            try:
+                self._write_output(publisher, output_file, rendered, manifest)
+            finally:
+                max_pending_writes.release()
+
+        with get_process_pool(self, self.jobs) as pool:
+            # the workers are forked on the first submit, so start them before any writer threads exist
+            results = pool.map(render_route, urls, chunksize=get_chunksize(len(urls), self.jobs))
+
+            with ThreadPoolExecutor(self.WRITER_THREADS) as writers:
+                write_futures = []
+                for url, rendered, elapsed, image_log, profile_log in results:
+                    progress.advance()
 
-            output_path = self.output_path
-            endpoint_output_path = endpoint.get_output_path()
+                    # templates can request new image versions, merge those in the same order the serial path would
+                    self.wisdom.merge_image_log(image_log)
+                    if profile_log is not None:
+                        self.profiler.merge_worker_log(profile_log)
 
-            suffix = endpoint_output_path.suffix
-            if suffix:
-                fname = endpoint_output_path.name
-                if suffix == '.xml':
-                    rendered = rendered.lstrip() # strip leading whitespace from xml files to avoid XML parsing error
+                    if rendered is None:
+                        continue
+
+                    endpoint = self.routes[url]
+                    self._add_timing(timings, endpoint, elapsed)
+
+                    output_file = self.get_output_file(endpoint)
+                    manifest = endpoint.manifest
+
+                    max_pending_writes.acquire()
+                    write_futures.append(writers.submit(write, output_file, rendered, manifest))
+
+                for future in write_futures:
+                    future.result() # re-raise any write errors
+
+        progress.finish()
+        self.wisdom.save()
+
+
+    def _add_timing(self, timings, endpoint, elapsed):
+        timing = timings.setdefault(type(endpoint).__name__, [0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+
+        if self.profiler is not None:
+            self.profiler.add_route(endpoint.url, type(endpoint).__name__, elapsed)
+
+
+    def _print_timings(self, timings):
+        logger.info('Render time by endpoint class:')
+        for class_name, (count, total) in sorted(timings.items(), key=lambda x: x[1][1], reverse=True):
+            logger.info(f'  {class_name:<24} {count:>7} pages {total:>10.3f}s {total / count * 1000:>9.2f}ms/page')
+
+
+    # incremental=True only rewrites output files whose bytes changed and removes the ones that are no longer
+    # published, rather than wiping the output directory and rewriting everything
+    def generate(self, incremental=False):
+        publisher = Publisher(self.output_path, self.wisdom.get_publish_manifest(), incremental, precompress=self.config.get('precompress', False))
+        publisher.begin()
+
+        timings = {} # endpoint class name: [count, total seconds]
+
+        with self._profile('generate: render routes'):
+            if self.jobs and can_fork():
+                self._generate_parallel(publisher, timings)
             else:
-                output_path = output_path / endpoint_output_path
-                fname = 'index.html'
+                self._generate_serial(publisher, timings)
+                self.wisdom.save() # templates can request new image versions
+
+        with self._profile('generate: copy static'):
+            self._copy_static(publisher)
+        with self._profile('generate: copy images'):
+            self._copy_cached_imgs(publisher)
+
+        self.wisdom.set_publish_manifest(publisher.finish())
+
+        self._print_timings(timings)
+        self.wisdom.print_cache_stats()
+
+        if self.profiler is not None:
+            self.profiler.add_published(publisher.num_written, publisher.bytes_written)
+            self.profiler.write_report(self.site_path / self.PROFILE_FILE, self.wisdom.cache_stats)
+
+
+    # Only renders and writes the given routes and removes stale_output_files, keeping everything else that was
+    # already published. Used by the watcher, which works out which routes a change affects
+    def generate_routes(self, urls, stale_output_files=()):
+        publisher = Publisher(self.output_path, self.wisdom.get_publish_manifest(), partial=True, precompress=self.config.get('precompress', False))
 
-            output_path.mkdir(parents=True, exist_ok=True)
+        for output_file in stale_output_files:
+            publisher.remove(output_file)
 
-            with open(output_path / fname, 'w') as f:
-                f.write(rendered)
+        timings = {}
+        self._generate_serial(publisher, timings, urls)
+        self.wisdom.save() # templates can request new image versions
 
-            # copy any files listed in meta.manifest
-            manifest = endpoint.meta.get('manifest', [])
-            for srp in manifest:
-                from_path = self.site_path / srp
-                to_path = output_path / srp.name
-                shutil.copyfile(from_path, to_path)
+        self._copy_cached_imgs(publisher)
 
-        self._copy_static()
-        self._copy_cached_imgs()
+        self.wisdom.set_publish_manifest(publisher.finish())
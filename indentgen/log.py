@@ -0,0 +1,96 @@
+import sys
+import json
+import time
+import logging
+
+# Every module logs to a child of the 'indentgen' logger (logging.getLogger(__name__)). Nothing is shown until
+# configure() is called, other than warnings and errors through logging's last resort handler, so builds run
+# from other scripts stay quiet.
+#
+# Per item messages (every route rendered, every image resized) are logged at debug. At info, the hot loops only
+# report through Progress, which logs at most once every PROGRESS_INTERVAL seconds.
+
+LOGGER_NAME = 'indentgen'
+LEVELS = ('debug', 'info', 'warning', 'error')
+
+PROGRESS_INTERVAL = 2.0 # seconds
+
+
+class JsonFormatter(logging.Formatter):
+    # one json object per line for CI. Progress records carry their counts in 'progress'
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+
+        progress = getattr(record, 'progress', None)
+        if progress is not None:
+            entry['progress'] = progress
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+
+def configure(level='info', json_format=False, stream=None):
+    logger = logging.getLogger(LOGGER_NAME)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter('%(message)s'))
+
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+class Progress:
+    # Counts the items a phase has processed and logs how far along it is, rate limited so a 30k route build
+    # doesn't spend its time writing to the terminal.
+    #
+    #   progress = Progress(logger, 'Rendered', 'routes', len(urls))
+    #   for ...:
+    #       progress.advance()
+    #   progress.finish()
+
+    def __init__(self, logger, action, unit, total=None, interval=PROGRESS_INTERVAL):
+        self.logger = logger
+        self.action = action
+        self.unit = unit
+        self.total = total
+        self.interval = interval
+        self.count = 0
+        self.start = time.perf_counter()
+        self.last_logged = self.start
+
+
+    def advance(self, num=1):
+        self.count += num
+
+        now = time.perf_counter()
+        if now - self.last_logged >= self.interval:
+            self.last_logged = now
+            self._log(now)
+
+
+    def finish(self):
+        if self.count:
+            self._log(time.perf_counter())
+
+
+    def _log(self, now):
+        elapsed = now - self.start
+        rate = self.count / elapsed if elapsed else 0.0
+        of_total = f'/{self.total}' if self.total is not None else ''
+
+        self.logger.info(
+            f'{self.action} {self.count}{of_total} {self.unit} ({rate:.1f}/s)',
+            extra={'progress': {'action': self.action, 'unit': self.unit, 'count': self.count, 'total': self.total, 'elapsed': elapsed, 'rate': rate}}
+        )
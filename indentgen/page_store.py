@@ -1,18 +1,38 @@
 class PageStore:
     def __init__(self, init=None):
         self.pages = init if init else []
+        self._invalidate()
+
+
+    def _invalidate(self):
+        # drop everything derived from self.pages, called whenever the pages change
+        self._topic_index = None
+        self._views = {} # (sort name, args): PageStoreView
+
+
+    def _get_view(self, view_key, sort_pages):
+        # The sorts are cached as read only views since templates call recent() etc. over and over for the same store.
+        # sort_pages is only called on a miss
+        view = self._views.get(view_key)
+        if view is None:
+            view = PageStoreView(sort_pages())
+            self._views[view_key] = view
+        return view
 
 
     def add(self, endpoint):
         self.pages.append(endpoint)
+        self._invalidate()
 
 
     def remove(self, endpoint):
         self.pages.remove(endpoint)
+        self._invalidate()
 
 
     def extend(self, endpoint_list_or_pagestore):
         self.pages.extend(endpoint_list_or_pagestore)
+        self._invalidate()
 
 
     def extendleft(self, endpoint_list_or_pagestore):
@@ -25,16 +45,15 @@ class PageStore:
             extended.append(endpoint)
 
         self.pages = extended
+        self._invalidate()
 
 
     def order_by_date(self, descending=True): # sort from latest to earliest (descending) by default
-        sort = sorted(self.pages, key=lambda x: x.meta['date'], reverse=descending)
-        return PageStore(sort)
+        return self._get_view(('date', descending), lambda: sorted(self.pages, key=lambda x: x.meta_record['date'], reverse=descending))
 
 
     def order_by_title(self, descending=False):
-        sort = sorted(self.pages, key=lambda x: x.meta['title'], reverse=descending)
-        return PageStore(sort)
+        return self._get_view(('title', descending), lambda: sorted(self.pages, key=lambda x: x.meta['title'], reverse=descending))
 
 
     def recent(self):
@@ -50,7 +69,7 @@ class PageStore:
 
 
     def only_dated(self):
-        return PageStore([endpoint for endpoint in self.pages if endpoint.meta.get('date')])
+        return PageStore([endpoint for endpoint in self.pages if endpoint.meta_record.get('date')])
 
 
     def group_by_date(self):
@@ -58,24 +77,35 @@ class PageStore:
         by_months = {}
 
         for endpoint in self:
-            date = endpoint.meta['date']
+            date = endpoint.meta_record['date']
             by_months.setdefault((date.year, date.month), PageStore()).add(endpoint)
 
         return by_months
 
 
+    def _get_topic_index(self):
+        # {taxonomy slug_path: [endpoint, ...]} in page order. Built in a single pass the first time a topic is
+        # looked up, so filtering by every taxonomy doesn't scan every page once per taxonomy
+        if self._topic_index is None:
+            topic_index = {}
+            for endpoint in self.pages:
+                for slug in endpoint.taxonomies:
+                    topic_index.setdefault(slug, []).append(endpoint)
+            self._topic_index = topic_index
+        return self._topic_index
+
+
     def filter_by_topic(self, slug):
         filtered = []
         parts = {}
-        for endpoint in self.pages:
-            if slug in endpoint.taxonomies:
-                part = endpoint.taxonomies[slug]
-                if part is not None:
-                    collision_part = parts.get(part)
-                    if collision_part is not None:
-                        raise Exception(f"Pages cannot have the same part '{part}' for taxonomy '{slug}': {endpoint.srp} and {collision_part.srp}")
-                    parts[part] = endpoint
-                filtered.append(endpoint)
+        for endpoint in self._get_topic_index().get(slug, []):
+            part = endpoint.taxonomies[slug]
+            if part is not None:
+                collision_part = parts.get(part)
+                if collision_part is not None:
+                    raise Exception(f"Pages cannot have the same part '{part}' for taxonomy '{slug}': {endpoint.srp} and {collision_part.srp}")
+                parts[part] = endpoint
+            filtered.append(endpoint)
 
         # sort by parts/orders
         filtered_and_sorted = sorted(filtered, key=lambda x: x.taxonomies[slug] if x.taxonomies[slug] is not None else len(filtered))
@@ -96,6 +126,10 @@ class PageStore:
 
 
     def list_view_sort(self, slug):
+        return self._get_view(('list_view', slug), lambda: self._list_view_sort(slug))
+
+
+    def _list_view_sort(self, slug):
         # sort precedence:
         # 1. taxonomy order
         # 2. taxonomies in alphabetical order
@@ -113,16 +147,16 @@ class PageStore:
                 ordered.append(endpoint)
             elif endpoint.is_taxonomy:
                 taxonomies.append(endpoint)
-            elif endpoint.meta.get('date'):
+            elif endpoint.meta_record.get('date'):
                 pages.append(endpoint)
             else:
                 no_date.append(endpoint)
 
-            ordered.sort(key=lambda x: x.taxonomies[slug])
-            taxonomies.sort(key=lambda x: x.meta['title'])
-            pages.sort(key=lambda x: x.meta['date'], reverse=True)
+        ordered.sort(key=lambda x: x.taxonomies[slug])
+        taxonomies.sort(key=lambda x: x.meta_record['title'])
+        pages.sort(key=lambda x: x.meta_record['date'], reverse=True)
 
-        return PageStore(ordered + taxonomies + pages + no_date)
+        return ordered + taxonomies + pages + no_date
 
 
     def annotate_nav(self, descending=False):
@@ -148,3 +182,16 @@ class PageStore:
 
     def __add__(self, other):
         return PageStore(self.pages + other.pages)
+
+
+class PageStoreView(PageStore):
+    # A cached sort of a PageStore. The same view is handed to every caller, so it can't be modified. Copy it into a
+    # new PageStore (i.e. PageStore(list(view))) to get one that can be.
+
+    def _read_only(self, *args):
+        raise Exception('Sorted PageStore views are read only. Copy into a new PageStore to modify')
+
+    add = _read_only
+    remove = _read_only
+    extend = _read_only
+    extendleft = _read_only
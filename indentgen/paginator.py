@@ -57,66 +57,75 @@ def get_links(num_pages, on_page, slots): # on_page 1 indexed
 
 
 class Paginator:
+    # Pages and their endpoints are only made when they're asked for (rendered, looked up in the RouteTable or
+    # linked to from another page), rather than up front for every listing on the site. The first page is the
+    # base endpoint passed in, which always has its paginator_page attached.
 
     class Page:
-        def __init__(self, paginator, page_num_0, start_index, end_index, prev_endpoint, next_endpoint):
+        def __init__(self, paginator, page_num_0):
             self.paginator = paginator
-            self.items = paginator.items[start_index:end_index]
             self.page_num = page_num_0 + 1 # 1 indexed
-            self.start_index = start_index
-            self.end_index = end_index
-            self.prev_endpoint = prev_endpoint
-            self.next_endpoint = next_endpoint
+            self.start_index = page_num_0 * paginator.per_page
+            self.end_index = min(self.start_index + paginator.per_page, paginator.total)
+            self.num_items_on_page = self.end_index - self.start_index
+            self._items = None
 
-            self.num_items_on_page = len(self.items)
+        @property
+        def items(self):
+            if self._items is None:
+                self._items = self.paginator.items[self.start_index:self.end_index]
+            return self._items
+
+        @property
+        def prev_endpoint(self):
+            if self.page_num == 1:
+                return None
+            return self.paginator.get_page_endpoint(self.page_num - 1)
+
+        @property
+        def next_endpoint(self):
+            if self.page_num >= self.paginator.num_of_pages:
+                return None
+            return self.paginator.get_page_endpoint(self.page_num + 1)
 
         @property
         def has_next(self):
-            return self.next_endpoint is not None
+            return self.page_num < self.paginator.num_of_pages
 
         @property
         def has_prev(self):
-            return self.prev_endpoint is not None
+            return self.page_num > 1
 
 
-    def __init__(self, child_items, per_page):
+    def __init__(self, child_items, per_page, base_endpoint):
         self.items = child_items
         self.per_page = per_page
         self.total = len(child_items)
         self.num_of_pages = math.ceil(self.total / per_page)
-        self._endpoint_objs = []
+        self.base_endpoint = base_endpoint
+        self._endpoint_objs = {} # 0 based page index: endpoint, for the pages made so far
 
+        self.get_page_endpoint(1)
 
-    def _attach_page(self, list_endpoint, prev_endpoint): # 0 based page index read off of list_endpoint_obj
-        page_num = list_endpoint.page
-        start_index = page_num * self.per_page
-        end_index = start_index + self.per_page
-        if end_index > self.total:
-            end_index = self.total
 
-        #prev_endpoint = list_endpoint.prev_page()
-        next_endpoint = list_endpoint.next_page() if (page_num + 1) < self.num_of_pages else None
+    @property
+    def num_of_routes(self):
+        return max(self.num_of_pages, 1) # the first page is published even when there's nothing to list
 
-        #return Page(self, page_num, start_index, end_index, prev_endpoint, next_endpoint)
-        list_endpoint.paginator_page = self.Page(self, page_num, start_index, end_index, prev_endpoint, next_endpoint)
-        self._endpoint_objs.append(list_endpoint)
-        return list_endpoint
 
-
-    def gen_all_pages(self, list_endpoint_0):
-        prev_endpoint = None
-        annotated_endpoint = self._attach_page(list_endpoint_0, prev_endpoint)
-        yield annotated_endpoint
-
-        while annotated_endpoint.paginator_page.next_endpoint is not None:
-            prev_endpoint = annotated_endpoint
-            next_endpoint = annotated_endpoint.paginator_page.next_endpoint
-            annotated_endpoint = self._attach_page(next_endpoint, prev_endpoint)
-            yield annotated_endpoint
+    def get_page_endpoint(self, page_num): # 1-indexed
+        page_index = page_num - 1
+        endpoint = self._endpoint_objs.get(page_index)
+        if endpoint is None:
+            endpoint = self.base_endpoint if page_index == 0 else self.base_endpoint.get_page(page_index)
+            endpoint.paginator_page = self.Page(self, page_index)
+            self._endpoint_objs[page_index] = endpoint
+        return endpoint
 
 
-    def get_page_endpoint(self, page_num): # 1-indexed
-        return self._endpoint_objs[page_num - 1]
+    def gen_all_pages(self):
+        for page_num in range(1, self.num_of_routes + 1):
+            yield self.get_page_endpoint(page_num)
 
 
     def gen_all_page_endpoints(self, on_page, slots): # on_page 1-indexed
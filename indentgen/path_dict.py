@@ -1,38 +1,50 @@
 from pathlib import Path
 
 class PathDict:
+    # Maps paths to data, where looking up a path finds the data of the closest (longest) key path containing it.
+    # Keys are stored in a trie of path components, so a lookup only walks the parts of the path being looked up.
+
     def __init__(self):
-        self._ordered_path_keys = []
+        self._root = {'children': {}, 'key': None}
         self._data_dict = {}
+        self._keys_by_depth = {} # depth: [key, ...] in insertion order
 
 
     def add(self, path_or_f, data):
         key = Path(path_or_f)
 
         if key not in self._data_dict:
-            # key does not exist. Add new key and order it
-            self._ordered_path_keys.append(key)
-            self._ordered_path_keys.sort(key=lambda x: len(x.parts), reverse=True)
+            # key does not exist. Add new node for it
+            node = self._root
+            for part in key.parts:
+                node = node['children'].setdefault(part, {'children': {}, 'key': None})
+            node['key'] = key
+            self._keys_by_depth.setdefault(len(key.parts), []).append(key)
 
         self._data_dict[key] = data
 
 
     def get(self, path_or_f):
         # fetches the key that matches the closest relative path
-        key = Path(path_or_f)
+        node = self._root
+        closest_key = node['key']
+
+        for part in Path(path_or_f).parts:
+            node = node['children'].get(part)
+            if node is None:
+                break
+            if node['key'] is not None:
+                closest_key = node['key']
 
-        for path in self._ordered_path_keys:
-            try:
-                key.relative_to(path)
-                return self._data_dict[path]
-            except ValueError:
-                pass
-        return None
+        if closest_key is None:
+            return None
+        return self._data_dict[closest_key]
 
 
     def __iter__(self):
         # when iterating over these to validate, we should check the highest path first (i.e. path with least parts)
-        # in case children subsites depend on a parent higher in the path tree. Since the keys are ordered from paths with the most
-        # parts to paths with the least, iterate over this object in reverse key order.
-        for key in reversed(self._ordered_path_keys):
-            yield self._data_dict[key]
+        # in case children subsites depend on a parent higher in the path tree. Paths with the same number of parts
+        # come most recently added first.
+        for depth in sorted(self._keys_by_depth):
+            for key in reversed(self._keys_by_depth[depth]):
+                yield self._data_dict[key]
@@ -0,0 +1,138 @@
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    # Collects where build time goes for `--profile`: how long each Indentgen phase took, how long each source
+    # took to parse and render, how long each template and route took to render, bytes published and the wisdom
+    # cache hit ratios. The report is written as json and the slowest TOP_N sources, templates and routes are
+    # printed.
+    #
+    # Template times include anything the template pulls in lazily, i.e. rendering the page bodies it lists.
+    #
+    # Worker processes time into their own (forked) copy, pop_worker_log/merge_worker_log ship those timings back
+    # to the parent in the same way as the wisdom image log.
+
+    TOP_N = 10
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = [] # [[name, seconds]] in the order the phases started
+        self.sources = {} # {srp: {'meta': seconds, 'parse': seconds, 'render': seconds}}
+        self.templates = {} # {template name: [count, total seconds]}
+        self.routes = [] # [(url, endpoint class name, seconds)]
+        self.bytes_written = 0
+        self.files_written = 0
+
+
+    @contextmanager
+    def phase(self, name):
+        timing = [name, None]
+        self.phases.append(timing)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing[1] = time.perf_counter() - start
+
+
+    def add_source(self, srp, step, elapsed):
+        timing = self.sources.setdefault(srp, {'meta': 0.0, 'parse': 0.0, 'render': 0.0})
+        timing[step] += elapsed
+
+
+    def add_template(self, template_name, elapsed, count=1):
+        timing = self.templates.setdefault(template_name, [0, 0.0])
+        timing[0] += count
+        timing[1] += elapsed
+
+
+    def add_route(self, url, class_name, elapsed):
+        self.routes.append((url, class_name, elapsed))
+
+
+    def add_published(self, num_written, bytes_written):
+        self.files_written += num_written
+        self.bytes_written += bytes_written
+
+
+    def pop_worker_log(self):
+        log = (self.sources, self.templates)
+        self.sources = {}
+        self.templates = {}
+        return log
+
+
+    def merge_worker_log(self, log):
+        sources, templates = log
+
+        for srp, timing in sources.items():
+            for step, elapsed in timing.items():
+                self.add_source(srp, step, elapsed)
+
+        for template_name, (count, total) in templates.items():
+            self.add_template(template_name, total, count)
+
+
+    def get_report(self, cache_stats):
+        caches = {}
+        for cache_name, stats in sorted(cache_stats.items()):
+            total = stats['hits'] + stats['misses']
+            caches[cache_name] = {**stats, 'hit_ratio': stats['hits'] / total if total else None}
+
+        sources = [{'srp': str(srp), **timing, 'total': sum(timing.values())} for srp, timing in self.sources.items()]
+        templates = [{'template': name, 'count': count, 'total': total} for name, (count, total) in self.templates.items()]
+        routes = [{'url': url, 'endpoint': class_name, 'seconds': elapsed} for url, class_name, elapsed in self.routes]
+
+        return {
+            'total_seconds': time.perf_counter() - self.start,
+            'phases': [{'name': name, 'seconds': elapsed} for name, elapsed in self.phases],
+            'sources': sorted(sources, key=lambda x: x['total'], reverse=True),
+            'templates': sorted(templates, key=lambda x: x['total'], reverse=True),
+            'routes': sorted(routes, key=lambda x: x['seconds'], reverse=True),
+            'files_written': self.files_written,
+            'bytes_written': self.bytes_written,
+            'caches': caches
+        }
+
+
+    def write_report(self, report_path, cache_stats):
+        report = self.get_report(cache_stats)
+
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.print_report(report)
+        logger.info(f'Profile written to {report_path}')
+
+
+    def print_report(self, report):
+        top_n = self.TOP_N
+
+        logger.info(f"Profile: {report['total_seconds']:.3f}s total, {report['files_written']} files ({report['bytes_written']} bytes) written")
+
+        logger.info('Phases:')
+        for phase in report['phases']:
+            logger.info(f"  {phase['name']:<40} {phase['seconds']:>10.3f}s")
+
+        logger.info(f'Slowest {top_n} sources:')
+        for source in report['sources'][:top_n]:
+            logger.info(f"  {source['srp']:<60} {source['total']:>9.3f}s (meta {source['meta']:.3f}s, parse {source['parse']:.3f}s, render {source['render']:.3f}s)")
+
+        logger.info(f'Slowest {top_n} templates:')
+        for template in report['templates'][:top_n]:
+            logger.info(f"  {template['template']:<40} {template['count']:>7} renders {template['total']:>10.3f}s {template['total'] / template['count'] * 1000:>9.2f}ms/render")
+
+        logger.info(f'Slowest {top_n} routes:')
+        for route in report['routes'][:top_n]:
+            logger.info(f"  {route['url']:<60} {route['endpoint']:<24} {route['seconds'] * 1000:>9.2f}ms")
+
+        logger.info('Cache hit ratios:')
+        for cache_name, stats in report['caches'].items():
+            ratio = f"{stats['hit_ratio'] * 100:.1f}%" if stats['hit_ratio'] is not None else '-'
+            logger.info(f'  {cache_name:<16} {ratio:>7}')
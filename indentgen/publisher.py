@@ -0,0 +1,195 @@
+import gzip
+import shutil
+import hashlib
+import logging
+import threading
+
+try:
+    import brotli
+except ImportError: # optional, only .gz variants are published without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class Publisher:
+    # Writes everything that ends up in the output directory and keeps a manifest of what was published,
+    # keyed by the path relative to the output directory.
+    #
+    # In incremental mode, files whose bytes are unchanged since the last publish are not rewritten (so their
+    # mtimes are left alone) and only files that were published last time but not this time are removed.
+    # Otherwise the output directory is wiped and everything is written fresh.
+    #
+    # In partial mode only some of the site is being republished, so files that aren't published this time are
+    # kept (and stay in the manifest) and only the ones passed to remove() are deleted.
+    #
+    # With precompress, compressed variants of text files are written next to them (index.html.gz, index.html.br)
+    # so that they're compressed once per publish rather than once per request.
+    #
+    # manifest: {relative_path: {'hash': hex digest, 'src_mts': float or None, 'src_size': int or None, 'variants': [suffix]}}
+    # src_mts/src_size are only set for copied files so unchanged sources don't have to be re-hashed. variants are the
+    # suffixes of the precompressed variants published alongside the file
+
+    VARIANT_SUFFIXES = ('.gz', '.br')
+    PRECOMPRESS_EXTENSIONS = ('.html', '.xml', '.css', '.js', '.json', '.svg', '.txt')
+    MIN_PRECOMPRESS_SIZE = 512 # bytes, same as the preview server's
+
+    def __init__(self, output_path, manifest=None, incremental=False, partial=False, precompress=False):
+        self.output_path = output_path
+        self.partial = partial
+        self.precompress = precompress
+        self.incremental = (incremental or partial) and manifest is not None # can't be incremental without a previous manifest
+        self.old_manifest = dict(manifest) if self.incremental else {}
+        self.manifest = {}
+
+        self.num_written = 0
+        self.num_unchanged = 0
+        self.num_removed = 0
+        self.bytes_written = 0
+
+        self._lock = threading.Lock() # files are published from the writer threads in parallel mode
+
+
+    @staticmethod
+    def get_hash(data):
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+    def begin(self):
+        if not (self.incremental or self.partial):
+            # remove old/stale published content
+            shutil.rmtree(self.output_path, ignore_errors=True) # if dir doesn't exist, ignore error
+
+
+    def _get_unchanged(self, rel_path, file_hash):
+        old_record = self.old_manifest.get(rel_path)
+        if old_record and old_record['hash'] == file_hash and (self.output_path / rel_path).exists():
+            return old_record
+        return None
+
+
+    def _record(self, rel_path, record, written, size=0):
+        with self._lock:
+            self.manifest[rel_path] = record
+            if written:
+                self.num_written += 1
+                self.bytes_written += size
+            else:
+                self.num_unchanged += 1
+
+
+    def _get_variants(self, output_file, size):
+        if not self.precompress or size < self.MIN_PRECOMPRESS_SIZE or output_file.suffix.lower() not in self.PRECOMPRESS_EXTENSIONS:
+            return []
+        return list(self.VARIANT_SUFFIXES) if brotli is not None else ['.gz']
+
+
+    def _has_variants(self, output_file, record, variants):
+        return record.get('variants', []) == variants and all(output_file.with_name(output_file.name + suffix).exists() for suffix in variants)
+
+
+    def _write_variants(self, rel_path, output_file, data, variants, written):
+        old_record = self.old_manifest.get(rel_path, {})
+
+        for suffix in old_record.get('variants', []):
+            if suffix not in variants:
+                self._unlink(output_file.with_name(output_file.name + suffix))
+
+        if not written and self._has_variants(output_file, old_record, variants):
+            return
+
+        for suffix in variants:
+            compressed = brotli.compress(data) if suffix == '.br' else gzip.compress(data, mtime=0)
+            with open(output_file.with_name(output_file.name + suffix), 'wb') as f:
+                f.write(compressed)
+
+
+    def write_text(self, output_file, text):
+        rel_path = output_file.relative_to(self.output_path).as_posix()
+        data = text.encode('utf-8')
+        file_hash = self.get_hash(data)
+        variants = self._get_variants(output_file, len(data))
+
+        written = self._get_unchanged(rel_path, file_hash) is None
+        if written:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_file, 'wb') as f:
+                f.write(data)
+        self._write_variants(rel_path, output_file, data, variants, written)
+
+        self._record(rel_path, {'hash': file_hash, 'src_mts': None, 'src_size': None, 'variants': variants}, written, len(data))
+
+
+    def copy_file(self, from_path, output_file):
+        rel_path = output_file.relative_to(self.output_path).as_posix()
+        stat = from_path.stat()
+        variants = self._get_variants(output_file, stat.st_size)
+
+        old_record = self.old_manifest.get(rel_path)
+        if old_record and old_record['src_mts'] == stat.st_mtime and old_record['src_size'] == stat.st_size and output_file.exists() \
+                and self._has_variants(output_file, old_record, variants):
+            # source untouched since it was last published, skip hashing it
+            self._record(rel_path, old_record, False)
+            return
+
+        with open(from_path, 'rb') as f:
+            data = f.read()
+        file_hash = self.get_hash(data)
+
+        written = self._get_unchanged(rel_path, file_hash) is None
+        if written:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(from_path, output_file)
+        self._write_variants(rel_path, output_file, data, variants, written)
+
+        self._record(rel_path, {'hash': file_hash, 'src_mts': stat.st_mtime, 'src_size': stat.st_size, 'variants': variants}, written, stat.st_size)
+
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+    def _remove(self, rel_path):
+        stale_file = self.output_path / rel_path
+        for suffix in self.VARIANT_SUFFIXES:
+            self._unlink(stale_file.with_name(stale_file.name + suffix))
+
+        try:
+            stale_file.unlink()
+        except FileNotFoundError:
+            return
+        self.num_removed += 1
+
+        # prune any directories left empty
+        parent = stale_file.parent
+        while parent != self.output_path:
+            try:
+                parent.rmdir()
+            except OSError:
+                break # not empty
+            parent = parent.parent
+
+
+    def remove(self, output_file):
+        rel_path = output_file.relative_to(self.output_path).as_posix()
+        self.old_manifest.pop(rel_path, None)
+        self.manifest.pop(rel_path, None)
+        self._remove(rel_path)
+
+
+    def finish(self):
+        if self.partial:
+            # everything that wasn't republished stays as it was
+            manifest = {**self.old_manifest, **self.manifest}
+        else:
+            # remove anything that was published last time but wasn't published this time
+            for rel_path in self.old_manifest.keys() - self.manifest.keys():
+                self._remove(rel_path)
+            manifest = self.manifest
+
+        logger.info(f'Published: {self.num_written} written, {self.num_unchanged} unchanged, {self.num_removed} removed')
+        return manifest
@@ -0,0 +1,169 @@
+from collections.abc import Mapping
+
+from indentgen.endpoints import PAGE_URL, RedirectEndpoint, make_url
+from indentgen.paginator import Paginator
+
+
+class PaginatedRoutes:
+    # A listing's routes kept as a range rather than an endpoint per url:
+    #   xxx/page/1/ and xxx/page/ redirect to xxx/
+    #   xxx/ is the base endpoint (page 1)
+    #   xxx/page/2/ ... xxx/page/N/ are made by the paginator when looked up
+    # The redirects are only made when looked up as well.
+
+    def __init__(self, paginator):
+        self.paginator = paginator
+        self.base_endpoint = paginator.base_endpoint
+        self.base_url = self.base_endpoint.url
+        self.redirect_urls = (f'{self.base_url}{PAGE_URL}/1/', f'{self.base_url}{PAGE_URL}/')
+        self._redirects = {}
+
+
+    def __len__(self):
+        return len(self.redirect_urls) + self.paginator.num_of_routes
+
+
+    def get_page_url(self, page_num): # 1-indexed
+        if page_num == 1:
+            return self.base_url
+        return f'{self.base_url}{PAGE_URL}/{page_num}/'
+
+
+    def gen_urls(self):
+        yield from self.redirect_urls
+        for page_num in range(1, self.paginator.num_of_routes + 1):
+            yield self.get_page_url(page_num)
+
+
+    def get_redirect(self, url):
+        redirect = self._redirects.get(url)
+        if redirect is None:
+            components = list(self.base_endpoint.url_components) + [PAGE_URL] # components could be tuples
+            if url == self.redirect_urls[0]:
+                components.append('1')
+            redirect = RedirectEndpoint(self.base_endpoint.indentgen, components, self.base_endpoint)
+            self._redirects[url] = redirect
+        return redirect
+
+
+    def get(self, url):
+        if url == self.base_url:
+            return self.base_endpoint
+
+        if url in self.redirect_urls:
+            return self.get_redirect(url)
+
+        page_part = url[len(self.base_url) + len(PAGE_URL) + 1:-1] # xxx/page/N/ -> N
+        if not page_part.isdigit() or str(int(page_part)) != page_part: # only the canonical form, i.e. not page/02/
+            return None
+
+        page_num = int(page_part)
+        if not 2 <= page_num <= self.paginator.num_of_routes:
+            return None
+
+        return self.paginator.get_page_endpoint(page_num)
+
+
+class RouteTable(Mapping):
+    # Indentgen.routes. A read-only mapping of url: endpoint as far as everything else is concerned, but paginated
+    # listings are stored as a PaginatedRoutes range and their page endpoints are only made when a url in the
+    # range is looked up (rendered, served or checked for a collision). Static files and resized images only
+    # store their endpoint class against their url, see add_static. Iterating yields urls in the order their
+    # routes were added, so keys() alone never makes any endpoints.
+
+    def __init__(self, indentgen_obj):
+        self.indentgen = indentgen_obj
+        self._routes = {} # url: endpoint, base url: PaginatedRoutes or url: StaticServeEndpoint (sub)class
+        self._paginated = {} # base url: PaginatedRoutes
+        self._len = 0
+
+
+    def __len__(self):
+        return self._len
+
+
+    def __iter__(self):
+        for url, route in self._routes.items():
+            if isinstance(route, PaginatedRoutes):
+                yield from route.gen_urls()
+            else:
+                yield url
+
+
+    def gen_urls_excluding(self, endpoint_class):
+        # the urls of every route that isn't an endpoint_class, without making any page endpoints. Paginated
+        # ranges are always listings, never endpoint_class
+        for url, route in self._routes.items():
+            if isinstance(route, PaginatedRoutes):
+                yield from route.gen_urls()
+            elif isinstance(route, type):
+                if not issubclass(route, endpoint_class):
+                    yield url
+            elif not isinstance(route, endpoint_class):
+                yield url
+
+
+    def __getitem__(self, url):
+        route = self._routes.get(url)
+        if route is not None:
+            if isinstance(route, PaginatedRoutes):
+                return route.base_endpoint
+            if isinstance(route, type):
+                return route(self.indentgen, url.strip('/').split('/')) # a static route, made fresh every lookup
+            return route
+
+        paginated = self._get_paginated(url)
+        endpoint = paginated.get(url) if paginated is not None else None
+        if endpoint is None:
+            raise KeyError(url)
+        return endpoint
+
+
+    def _get_paginated(self, url):
+        # xxx/page/ and xxx/page/N/ belong to the range based at xxx/
+        page_suffix = f'{PAGE_URL}/'
+        if url.endswith(f'/{page_suffix}'):
+            return self._paginated.get(url[:-len(page_suffix)])
+
+        head, sep, tail = url[:-1].rpartition('/')
+        if url.endswith('/') and head.endswith(f'/{PAGE_URL}'):
+            return self._paginated.get(head[:-len(PAGE_URL)])
+
+        return None
+
+
+    def _check_collision(self, url, endpoint):
+        collision_endpoint = self.get(url)
+        if collision_endpoint is not None:
+            raise Exception(f"URL conflict for '{url}': {endpoint.identifier} and {collision_endpoint.identifier}")
+
+
+    def add(self, endpoint):
+        url = endpoint.url
+        self._check_collision(url, endpoint)
+        self._routes[url] = endpoint
+        self._len += 1
+
+
+    def add_static(self, endpoint_class, url_components):
+        # a StaticServeEndpoint or CachedImgEndpoint route without keeping the endpoint around. They don't render
+        # anything and there can be tens of thousands of resized images
+        url = make_url(url_components)
+        if url in self:
+            self._check_collision(url, endpoint_class(self.indentgen, url_components))
+        self._routes[url] = endpoint_class
+        self._len += 1
+
+
+    def add_paginated(self, base_endpoint, per_page):
+        # page 1 is made right away, the base endpoint is what everything else links to and it should have its
+        # paginator_page like any other listing page
+        paginated = PaginatedRoutes(Paginator(base_endpoint.child_pages, per_page, base_endpoint))
+
+        for url in paginated.gen_urls():
+            self._check_collision(url, base_endpoint)
+
+        self._routes[paginated.base_url] = paginated
+        self._paginated[paginated.base_url] = paginated
+        self._len += len(paginated)
+        return paginated
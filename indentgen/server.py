@@ -0,0 +1,364 @@
+import gzip
+import logging
+import threading
+import mimetypes
+from pathlib import Path
+from urllib.parse import urlsplit, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import brotli
+except ImportError: # optional, responses are only gzipped without it
+    brotli = None
+
+from indentgen.endpoints import StaticServeEndpoint, Http404Endpoint
+from indentgen.publisher import Publisher
+from indentgen.watcher import Watcher
+
+logger = logging.getLogger(__name__)
+
+
+class PublishedSite:
+    # Serves the output directory for `indentgen serve`. ETags are the hashes from the publish manifest, which is
+    # re-read whenever the watcher republishes.
+
+    def __init__(self, indentgen_inst):
+        self.update(indentgen_inst, None)
+
+
+    def update(self, indentgen_inst, affected_urls):
+        self.indentgen = indentgen_inst
+        self.output_path = indentgen_inst.output_path.resolve()
+        self.manifest = indentgen_inst.wisdom.get_publish_manifest() or {}
+
+
+    # Returns one of:
+    #   ('redirect', location)
+    #   ('file', path, content type, etag)
+    #   ('body', status, content type, bytes, etag)
+    def resolve(self, request_path):
+        url = unquote(urlsplit(request_path).path)
+        output_path = self.output_path
+
+        path = (output_path / url.lstrip('/')).resolve()
+        if path != output_path and output_path not in path.parents:
+            path = None # outside of the output directory
+        elif path.is_dir():
+            if not url.endswith('/'):
+                return 'redirect', f'{url}/'
+            path = path / 'index.html'
+
+        if path is None or not path.is_file():
+            path = output_path / '404.html'
+            with open(path, 'rb') as f:
+                body = f.read()
+            return 'body', 404, 'text/html; charset=utf-8', body, get_file_etag(path)
+
+        record = self.manifest.get(path.relative_to(output_path).as_posix())
+        etag = f'"{record["hash"]}"' if record else get_file_etag(path)
+        return 'file', path, guess_type(path), etag
+
+
+class OnDemandSite:
+    # Serves a site straight from Indentgen.routes for `indentgen serve --on-demand`. Nothing is rendered until its
+    # url is requested, and then the result is kept in memory until a watched source change affects it. Static
+    # files are served from the theme and image versions from _wisdom (resized on first request if needed), so
+    # nothing is published to the output directory.
+    #
+    # cache: {url: (content type, body bytes, etag)}
+
+    def __init__(self, indentgen_inst):
+        self.indentgen = indentgen_inst
+        self.cache = {}
+
+        # rendering and wisdom aren't thread safe, so only one request resolves at a time. Files are read outside of it
+        self.lock = threading.Lock()
+
+        self._build_static_sources()
+
+
+    def _build_static_sources(self):
+        indentgen = self.indentgen
+        self.static_sources = {}
+        for meta in indentgen.static_file_mapping.values():
+            url = f"/{indentgen.STATIC_URL}/{meta['srp'].as_posix()}"
+            self.static_sources[url] = meta['from']
+
+
+    def update(self, indentgen_inst, affected_urls):
+        # called by the watcher after a rebuild. affected_urls is None when everything has to be re-rendered
+        with self.lock:
+            self.indentgen = indentgen_inst
+            if affected_urls is None:
+                self.cache = {}
+            else:
+                affected_urls = set(affected_urls)
+                self.cache = {url: cached for url, cached in self.cache.items() if url in indentgen_inst.routes and url not in affected_urls}
+            self._build_static_sources()
+
+
+    # returns the same as PublishedSite.resolve
+    def resolve(self, request_path):
+        url = unquote(urlsplit(request_path).path)
+
+        with self.lock:
+            indentgen = self.indentgen
+
+            endpoint = indentgen.routes.get(url)
+            if endpoint is None and not url.endswith('/'):
+                endpoint = indentgen.routes.get(f'{url}/')
+                if endpoint is not None and not isinstance(endpoint, StaticServeEndpoint):
+                    return 'redirect', f'{url}/'
+
+            if isinstance(endpoint, StaticServeEndpoint) or endpoint is None:
+                # static and image routes are stored with a trailing slash but served (and keyed in
+                # static_sources) without one
+                file_url = url.rstrip('/') if endpoint is not None else url
+                source = self._get_file(file_url)
+                if source is not None:
+                    return 'file', source, guess_type(source), get_file_etag(source)
+
+                # they don't render anything, a static route without a file is a 404 like any other missing url
+                return ('body', 404, *self._render(Http404Endpoint(indentgen)))
+
+            return ('body', 200, *self._render(endpoint))
+
+
+    def _render(self, endpoint):
+        cached = self.cache.get(endpoint.url)
+        if cached is None:
+            rendered = endpoint.render()
+            output_file = self.indentgen.get_output_file(endpoint)
+            if output_file.suffix == '.xml':
+                rendered = rendered.lstrip() # same as Indentgen._write_output
+                content_type = 'application/xml'
+            else:
+                content_type = 'text/html; charset=utf-8'
+            body = rendered.encode('utf-8')
+            cached = (content_type, body, f'"{Publisher.get_hash(body)}"')
+            self.cache[endpoint.url] = cached
+
+            # commit right away so the render is kept if the server is stopped
+            self.indentgen.wisdom.save()
+        return cached
+
+
+    def _get_file(self, url):
+        indentgen = self.indentgen
+
+        source = self.static_sources.get(url)
+        if source is not None:
+            return source
+
+        if url.startswith(f'/{indentgen.IMAGE_URL}/'):
+            # images requested by pages rendered since startup don't have routes yet, so look them up in wisdom
+            return indentgen.wisdom.get_image_file(Path(url))
+
+        # files listed in a page's meta.manifest are published next to it
+        parent_url, file_name = url.rsplit('/', 1)
+        endpoint = indentgen.routes.get(f'{parent_url}/')
+        if endpoint is not None:
+            for srp in endpoint.manifest:
+                if Path(srp).name == file_name:
+                    return indentgen.site_path / srp
+
+        return None
+
+
+def guess_type(path):
+    content_type = mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+    if content_type == 'text/html':
+        content_type += '; charset=utf-8'
+    return content_type
+
+
+def get_file_etag(path):
+    # weak, for files that aren't in the publish manifest
+    stat = path.stat()
+    return f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+class PreviewServer(ThreadingHTTPServer):
+    # Threaded so one slow response (i.e. a large image) doesn't hold up the rest of a page's requests. Compressed
+    # responses are kept in memory by etag, so each version of a file is only compressed once.
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, site):
+        super().__init__(address, PreviewHandler)
+        self.site = site
+        self.compressed = {} # {(etag, encoding): bytes}
+        self.compressed_lock = threading.Lock()
+
+
+    def get_compressed(self, etag, encoding, body):
+        key = (etag, encoding)
+        with self.compressed_lock:
+            compressed = self.compressed.get(key)
+
+        if compressed is None:
+            compressed = brotli.compress(body) if encoding == 'br' else gzip.compress(body, mtime=0)
+            with self.compressed_lock:
+                self.compressed[key] = compressed
+
+        return compressed
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, so every response needs a Content-Length
+
+    COMPRESSIBLE_TYPES = ('text/', 'application/xml', 'application/javascript', 'application/json', 'image/svg+xml')
+    MIN_COMPRESS_SIZE = 512 # bytes
+
+    # cache busted static files get a new name whenever they change, everything else has to be revalidated
+    IMMUTABLE = 'public, max-age=31536000, immutable'
+    REVALIDATE = 'no-cache'
+
+    # file extensions of precompressed variants (see the precompress config option), served if they're sitting next
+    # to the requested file
+    VARIANT_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+
+    def _respond(self, send_body):
+        try:
+            resolved = self.server.site.resolve(self.path)
+        except Exception as e:
+            logger.error(f'Error rendering {self.path}: {e}')
+            self.send_error(500, str(e))
+            return
+
+        if resolved[0] == 'redirect':
+            self.send_response(301)
+            self.send_header('Location', resolved[1])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if resolved[0] == 'file':
+            path, content_type, etag = resolved[1:]
+            status = 200
+            body = None # not read unless it has to be sent
+        else:
+            status, content_type, body, etag = resolved[1:]
+            path = None
+
+        cache_control = self.IMMUTABLE if self._is_cache_busted() else self.REVALIDATE
+
+        # settle on the encoding before the etag, which only gets the encoding's suffix if a compressed body is sent
+        encoding = self._get_encoding(content_type)
+        precompressed = False
+        if encoding and path is not None:
+            variant = path.with_name(path.name + self.VARIANT_EXTENSIONS[encoding])
+            if variant.is_file():
+                path = variant
+                precompressed = True
+            elif path.stat().st_size < self.MIN_COMPRESS_SIZE:
+                encoding = None # not worth it
+        elif encoding and len(body) < self.MIN_COMPRESS_SIZE:
+            encoding = None
+
+        if etag and encoding:
+            etag = f'{etag[:-1]}-{encoding}"' # each encoding is a different representation
+
+        if status == 200 and etag and self._etag_matches(etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            return
+
+        if path is not None:
+            with open(path, 'rb') as f:
+                body = f.read()
+
+        if encoding and not precompressed:
+            body = self.server.get_compressed(etag, encoding, body)
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if etag:
+            self.send_header('ETag', etag)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+
+        if send_body:
+            self.wfile.write(body)
+
+
+    def _etag_matches(self, etag):
+        # If-None-Match is a comma separated list of etags (or *), compared weakly
+        header = self.headers.get('If-None-Match')
+        if not header:
+            return False
+
+        candidates = [candidate.strip() for candidate in header.split(',')]
+        if '*' in candidates:
+            return True
+
+        strip_weak = lambda x: x[2:] if x.startswith('W/') else x
+        return strip_weak(etag) in [strip_weak(candidate) for candidate in candidates]
+
+
+    def _is_cache_busted(self):
+        indentgen = self.server.site.indentgen
+        url = unquote(urlsplit(self.path).path)
+        return url.startswith(f'/{indentgen.STATIC_URL}/') and Path(url).suffix in indentgen.CACHE_BUST_STATIC_EXTENSIONS
+
+
+    def _get_encoding(self, content_type):
+        if not content_type.startswith(self.COMPRESSIBLE_TYPES):
+            return None # images etc. are already compressed
+
+        accepted = {token.split(';')[0].strip() for token in self.headers.get('Accept-Encoding', '').split(',')}
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+
+    def log_message(self, format, *args):
+        pass # logging every request drowns out the build output
+
+
+def _serve(site, port):
+    with PreviewServer(('', port), site) as httpd:
+        logger.info(f'Server started at localhost:{port}')
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def serve(indentgen_inst, port, watch=False):
+    # serves the output directory. With watch, changes are republished as they're made
+    site = PublishedSite(indentgen_inst)
+
+    if watch:
+        watcher = Watcher(indentgen_inst)
+        watcher.listeners.append(site.update)
+        threading.Thread(target=watcher.watch, daemon=True).start()
+
+    _serve(site, port)
+
+
+def serve_on_demand(indentgen_inst, port):
+    site = OnDemandSite(indentgen_inst)
+
+    watcher = Watcher(indentgen_inst, publish=False, lock=site.lock)
+    watcher.listeners.append(site.update)
+    threading.Thread(target=watcher.watch, daemon=True).start()
+
+    _serve(site, port)
@@ -0,0 +1,66 @@
+from indentgen.page_store import PageStore
+
+
+class TaxonomyTree:
+    # Computed once per build from the taxonomy map so lookups up and down the taxonomy hierarchy don't have to walk it.
+    #
+    # ancestors: {slug_path: [slug_path, ...]} top level first, not including the taxonomy itself
+    # top_level_groups: {top level slug: [slug_path, ...]} in taxonomy map order
+    # descendant_page_counts: {slug_path: int} pages (not taxonomies) in the taxonomy and all of its descendants.
+    #   Only set once count_pages() has been called, after the taxonomy child pages are gathered
+
+    def __init__(self, taxonomy_map):
+        self.taxonomy_map = taxonomy_map
+        self.ancestors = {}
+        self.top_level_groups = {}
+        self.descendant_page_counts = {}
+        self._breadcrumbs = {}
+
+        for slug_path, info in taxonomy_map.items():
+            ancestors = []
+            focused = info
+            while 'parent' in focused:
+                ancestors.append(focused['parent'])
+                focused = taxonomy_map[focused['parent']]
+            ancestors.reverse()
+            self.ancestors[slug_path] = ancestors
+
+            self.top_level_groups.setdefault(info['top_level'], []).append(slug_path)
+
+
+    def count_pages(self):
+        counts = {}
+        for slug_path, info in self.taxonomy_map.items():
+            child_pages = info['endpoint'].child_pages
+            counts[slug_path] = sum(1 for endpoint in child_pages if not endpoint.is_taxonomy)
+
+        # every taxonomy's own pages count towards each of its ancestors
+        own_counts = dict(counts)
+        for slug_path, ancestors in self.ancestors.items():
+            for ancestor in ancestors:
+                counts[ancestor] += own_counts[slug_path]
+
+        self.descendant_page_counts = counts
+
+
+    def has_deep_children(self, slug_path):
+        return self.descendant_page_counts[slug_path] > 0
+
+
+    def get_top_level(self, slug_path):
+        return self.taxonomy_map[slug_path]['top_level']
+
+
+    def get_top_level_group(self, top_level): # used by templates
+        return PageStore([self.taxonomy_map[slug_path]['endpoint'] for slug_path in self.top_level_groups.get(top_level, [])])
+
+
+    def get_breadcrumbs(self, slug_path):
+        breadcrumbs = self._breadcrumbs.get(slug_path)
+        if breadcrumbs is None:
+            breadcrumbs = []
+            for ancestor in self.ancestors[slug_path]:
+                info = self.taxonomy_map[ancestor]
+                breadcrumbs.append({'title': info['title'], 'url': info['endpoint'].url})
+            self._breadcrumbs[slug_path] = breadcrumbs
+        return breadcrumbs
@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import threading
+from stat import S_ISDIR
+from pathlib import Path
+
+from indentgen.endpoints import StaticServeEndpoint, RedirectEndpoint, ContentGalleryEndpoint, Http404Endpoint, RssEndpoint, SiteMapEndpoint
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+    # Polls the site sources for changes while `indentgen serve --watch` is running and republishes only what
+    # they affect.
+    #
+    # On a change, the Indentgen is refreshed in place (see Indentgen.refresh) from the warm wisdom caches, so only the
+    # changed sources are re-parsed. When only content changed, the routes before and after are compared and only
+    # these are regenerated:
+    #   - routes that were added
+    #   - pages that changed or had to be re-rendered (i.e. a page linking to a pk whose url changed)
+    #   - listings containing those pages, or whose items changed (pagination shifts, new members)
+    #   - pages whose prev/next neighbours changed
+    #   - rss, sitemap and 404
+    # The outputs of routes that no longer exist are removed. Changes to templates, static files, taxonomies or
+    # config files affect the whole site, so those trigger a full (incremental) generate instead.
+    #
+    # With publish=False nothing is written, listeners are just told which routes were affected (None for all of them).
+    # The on demand server uses this to invalidate the pages it has cached. It passes its lock, which is held while
+    # the Indentgen is being refreshed.
+
+    POLL_INTERVAL = 0.25 # seconds
+
+    # always regenerated on any change
+    ALWAYS_AFFECTED = (Http404Endpoint, RssEndpoint, SiteMapEndpoint)
+
+    def __init__(self, indentgen_inst, publish=True, lock=None):
+        self.indentgen = indentgen_inst
+        self.publish = publish
+        self.lock = lock if lock is not None else threading.Lock()
+        self.listeners = [] # called with (Indentgen, affected urls or None for all) after each rebuild
+
+        # a failed refresh can leave the routes half built, so the rebuild after one is always a full one
+        self.failed = False
+
+        self.dirs = {} # dir: (mtime_ns, [subdirs], [files]) as of the last poll, see _take_snapshot
+        self.snapshot = self._take_snapshot()
+
+
+    def _gen_watched_roots(self):
+        indentgen = self.indentgen
+        site_path = indentgen.site_path
+
+        yield indentgen.config_file_path
+
+        yield indentgen.content_path
+        yield indentgen.taxonomy_path
+        yield site_path / indentgen.THEME_DIR
+
+        yield from site_path.glob(f'{indentgen.CUSTOM_DEFS_MODULE_NAME}*')
+
+
+    def _list_dir(self, dir_path, mtime):
+        subdirs = []
+        files = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if entry.name != '__pycache__':
+                        subdirs.append(Path(entry.path))
+                else:
+                    files.append(Path(entry.path))
+        return mtime, subdirs, files
+
+
+    def _take_snapshot(self):
+        # Directories are only listed again when their mtime changes (an entry was added, removed or renamed), so
+        # a poll is a stat of every watched file and directory rather than a walk of the whole site
+        dirs = {}
+        files = []
+
+        pending = list(self._gen_watched_roots())
+        while pending:
+            path = pending.pop()
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue # removed since it was listed
+
+            if not S_ISDIR(stat.st_mode):
+                files.append((path, stat))
+                continue
+
+            listing = self.dirs.get(path)
+            if listing is None or listing[0] != stat.st_mtime_ns:
+                try:
+                    listing = self._list_dir(path, stat.st_mtime_ns)
+                except FileNotFoundError:
+                    continue
+            dirs[path] = listing
+            pending.extend(listing[1])
+            pending.extend(listing[2])
+
+        self.dirs = dirs
+
+        return {path: (stat.st_mtime, stat.st_size) for path, stat in files}
+
+
+    def watch(self):
+        logger.info('Watching for changes')
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+
+            snapshot = self._take_snapshot()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys() if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+
+            if changed:
+                try:
+                    self.rebuild(changed)
+                except Exception as e:
+                    # keep watching, the next save will most likely fix it
+                    logger.error(f'Rebuild failed: {e}')
+
+
+    def rebuild(self, changed_paths):
+        start = time.perf_counter()
+
+        indentgen = self.indentgen
+        site_path = indentgen.site_path
+        changed_srps = {path.relative_to(site_path) for path in changed_paths}
+
+        for srp in sorted(changed_srps):
+            logger.info(f'Changed: {srp}')
+
+        if any(srp.parts[0].startswith(indentgen.CUSTOM_DEFS_MODULE_NAME) for srp in changed_srps):
+            logger.warning(f'Changes to {indentgen.CUSTOM_DEFS_MODULE_NAME} need a restart to take effect')
+            return
+
+        content_only = not self.failed and all(
+            srp.parts[0] == indentgen.CONTENT_DIR and srp.name != indentgen.CONFIG_FILE_NAME for srp in changed_srps
+        )
+
+        with self.lock:
+            self.failed = True
+
+            # the old routes are gone once refreshed, so they're summarised first
+            old_routes = self.get_route_signatures(indentgen) if content_only else None
+
+            indentgen.refresh()
+
+            urls = None
+            if content_only:
+                urls, stale_output_files = self.get_affected_routes(old_routes, indentgen, changed_srps)
+                if self.publish:
+                    logger.info(f'Regenerating {len(urls)} routes, removing {len(stale_output_files)}')
+                    indentgen.generate_routes(urls, stale_output_files)
+            elif self.publish:
+                indentgen.generate(incremental=True)
+
+            self.failed = False
+
+        for listener in self.listeners:
+            listener(indentgen, urls)
+
+        logger.info(f'Rebuilt in {time.perf_counter() - start:.3f}s')
+
+
+    def get_route_signatures(self, indentgen):
+        # {url: (output file, signature)} of every route that's rendered
+        signatures = {}
+        for url in indentgen.routes.gen_urls_excluding(StaticServeEndpoint):
+            endpoint = indentgen.routes[url]
+            signatures[url] = (indentgen.get_output_file(endpoint), self._get_signature(endpoint))
+        return signatures
+
+
+    def get_affected_routes(self, old_routes, indentgen, changed_srps):
+        # content that has to be re-rendered changed as well, even if its own source didn't
+        changed_srps = changed_srps | indentgen.wisdom.rendered_srps
+        for record in indentgen.content_index.gen_records(is_taxonomy=False):
+            if not record['rendered'] and not indentgen.wisdom.is_render_fresh(record['srp'], record['stat']):
+                changed_srps.add(record['srp'])
+
+        urls = []
+        for url in indentgen.routes.gen_urls_excluding(StaticServeEndpoint):
+            endpoint = indentgen.routes[url]
+            old_route = old_routes.get(url)
+            if old_route is None or self._depends_on(endpoint, changed_srps) or old_route[1] != self._get_signature(endpoint):
+                urls.append(url)
+
+        stale_output_files = []
+        for url, old_route in old_routes.items():
+            if url not in indentgen.routes:
+                stale_output_files.append(old_route[0])
+
+        return urls, stale_output_files
+
+
+    def _gen_listed(self, endpoint, depth=2):
+        # the endpoints shown on a listing page. Date archives list archives that list pages, so go one level down
+        if endpoint.paginator_page is not None:
+            items = endpoint.paginator_page.items
+        else:
+            items = endpoint.child_pages or []
+
+        for item in items:
+            yield item
+            if depth > 1 and item.srp is None and not isinstance(item, StaticServeEndpoint):
+                yield from self._gen_listed(item, depth - 1)
+
+
+    def _depends_on(self, endpoint, changed_srps):
+        if isinstance(endpoint, self.ALWAYS_AFFECTED):
+            return True
+
+        if isinstance(endpoint, RedirectEndpoint):
+            return False # only depends on the url it redirects to, see _get_signature
+
+        if isinstance(endpoint, ContentGalleryEndpoint):
+            return endpoint.gallery_endpoint.srp in changed_srps
+
+        if endpoint.srp in changed_srps:
+            return True
+
+        for neighbour in (getattr(endpoint, 'prev', None), getattr(endpoint, 'next', None)):
+            if neighbour is not None and neighbour.srp in changed_srps:
+                return True
+
+        return any(item.srp in changed_srps for item in self._gen_listed(endpoint))
+
+
+    def _get_signature(self, endpoint):
+        # what a route's output depends on besides the sources of the pages involved
+        if isinstance(endpoint, RedirectEndpoint):
+            return endpoint.to_endpoint.url
+
+        neighbours = tuple(getattr(endpoint, attr, None) for attr in ('prev', 'next'))
+        pages = ()
+        if endpoint.paginator_page is not None:
+            pages = (endpoint.paginator_page.prev_endpoint, endpoint.paginator_page.next_endpoint)
+
+        return (
+            type(endpoint).__name__,
+            endpoint.identifier,
+            tuple(neighbour.url if neighbour is not None else None for neighbour in neighbours + pages),
+            tuple(item.identifier for item in self._gen_listed(endpoint))
+        )
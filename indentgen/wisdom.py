@@ -1,9 +1,26 @@
 from uuid import uuid4
+from pathlib import Path
 import pickle
-
+import hashlib
+import time
+import logging
+from concurrent.futures import wait, FIRST_COMPLETED
+
+try:
+    from importlib.metadata import version, PackageNotFoundError
+except ImportError: # python < 3.8
+    version = None
+
+from indentgen import default_definitions, taxonomy_def_set
+from indentgen.wisdom_store import WisdomStore
 from indentgen.default_definitions import CONFIG_TAG_SET_NAME, SUBSITE_CONFIG_TAG_SET_NAME, TAXONOMY_TAG_SET_NAME, CONTENT_TAG_SET_NAME
+from indentgen.default_definitions.taxonomy_tag_defs import add_parent_taxonomy
 import dentmark
-from indentgen.img_resize_utils import resize
+from indentgen.img_resize_utils import resize_versions, get_image_size, get_resized_size
+from indentgen.workers import can_fork, get_resize_pool
+from indentgen.log import Progress
+
+logger = logging.getLogger(__name__)
 
 
 class PickleableTagDef:
@@ -13,9 +30,19 @@ class PickleableTagDef:
 
 
 class Wisdom:
-    WISDOM_DATA = 'wisdom_data.pickle'
+    WISDOM_DATA = 'wisdom_data.pickle' # legacy single pickle, migrated into WISDOM_DB on first load
+    WISDOM_DB = 'wisdom.sqlite3'
     IMAGE_CACHE_DIR = 'image_cache'
-    CACHED_IMAGE_TYPE = 'png'
+
+    # image_format config option: Pillow format
+    IMAGE_FORMATS = {'png': 'PNG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+    # source suffix: Pillow format for image_format 'keep'. Anything else is cached as png
+    KEEP_IMAGE_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG', '.webp': 'WEBP'}
+    IMAGE_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp', 'GIF': 'gif'}
+    DEFAULT_IMAGE_QUALITY = 85
+    # (image_format, quality, passthrough). Everything cached before the policy was configurable was made with this
+    DEFAULT_IMAGE_POLICY = ('png', None, False)
+    PENDING_RESIZES_PER_JOB = 2
 
     def __init__(self, indentgen_inst):
         self.indentgen = indentgen_inst
@@ -27,65 +54,417 @@ class Wisdom:
         self.img_url = indentgen_inst.IMAGE_URL # the URL prefix where resized images should be accessd from in the HTML
         self.img_output_path = indentgen_inst.img_output_path # directory where resized images should be published
         self.pickle_path = self.wisdom_path / self.WISDOM_DATA
+        self.db_path = self.wisdom_path / self.WISDOM_DB
 
         self.config_file_path = indentgen_inst.config_file_path
 
-        try:
-            with open(self.pickle_path, 'rb') as f:
-                self.data = pickle.load(f)
-        except FileNotFoundError:
-            self.data = {}
+        # set in worker processes. A detached Wisdom never writes to disk and logs the image
+        # versions it touches so the parent process can merge them back in order
+        self.detached = False
+        self._image_log = None
+
+        # cache name: {'hits': int, 'hash_hits': int, 'misses': int}. hash_hits are the hits where the mtime or
+        # size had changed but the content hash still matched
+        self.cache_stats = {}
+        self._counted = set()
+
+        # collects the dependencies of the page currently being rendered, see add_dependency
+        self._deps = None
+        self._defs_fingerprint = None
+
+        self.image_policy = self.DEFAULT_IMAGE_POLICY
+        self.image_srcset = None # (widths, sizes or None) when image_srcset_widths is configured, see set_image_policy
+
+        # serve path: {img_cache keys of the versions served at it, or whose original is}. Built on the first
+        # get_image_file call so the on demand server doesn't scan img_cache per request
+        self._image_index = None
+
+        # srps that were fully rendered (not loaded from the render_cache) by this instance, read by the watcher
+        self.rendered_srps = set()
+
+        self.store = WisdomStore(self.db_path)
+
+        if self.pickle_path.exists():
+            self._migrate_pickle()
 
 
+    def _migrate_pickle(self):
+        with open(self.pickle_path, 'rb') as f:
+            data = pickle.load(f)
+
+        for cache_name, entries in data.items():
+            if cache_name == 'config_cache':
+                # the only cache that isn't keyed
+                self.store.put(cache_name, 'config', entries)
+            else:
+                for key, entry in entries.items():
+                    self.store.put(cache_name, key, entry)
+
+        self.store.commit()
+        self.pickle_path.unlink()
+
+
+    # Entries are written to the store as they change, this commits them. Called at phase boundaries
+    # by Indentgen rather than after every cache miss.
     def save(self):
-        self.wisdom_path.mkdir(parents=True, exist_ok=True)
-        with open(self.pickle_path, 'wb') as f:
-            pickle.dump(self.data, f)
+        self.store.commit()
+
+
+    def close(self):
+        self.store.commit()
+        self.store.close()
+
+
+    # called before the sources are re-read by Indentgen.refresh, so the stats and rendered_srps are per rebuild
+    def reset_stats(self):
+        self.cache_stats = {}
+        self._counted = set()
+        self.rendered_srps = set()
+
+
+    @staticmethod
+    def _hash_file(abs_path):
+        with open(abs_path, 'rb') as f:
+            return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+    def _fingerprint(self, abs_path, stat, file_hash=None):
+        if file_hash is None:
+            file_hash = self._hash_file(abs_path)
+        return {'mts': stat.st_mtime, 'size': stat.st_size, 'hash': file_hash}
+
+
+    def _count(self, cache_name, key, counter):
+        # only count the first freshness check of each entry, some are checked more than once per build
+        if (cache_name, key, counter) in self._counted:
+            return
+        self._counted.add((cache_name, key, counter))
+        stats = self.cache_stats.setdefault(cache_name, {'hits': 0, 'hash_hits': 0, 'misses': 0, 'stale_deps': 0})
+        stats[counter] += 1
+
+
+    # Returns (is_fresh, file_hash). The mtime and size are checked first. If either differs (i.e. a git checkout
+    # or CI clone touched the file) the file is hashed and the cached entry is still fresh if the bytes are the
+    # same. file_hash is only set if the file had to be hashed, so a miss can reuse it.
+    def _check_fresh(self, cache_name, key, cached, abs_path, stat):
+        file_hash = None
+        is_fresh = False
+
+        if cached is not None:
+            # entries cached before content hashing was added have no size or hash
+            if cached['mts'] == stat.st_mtime and cached.get('size', stat.st_size) == stat.st_size:
+                is_fresh = True
+                if 'hash' not in cached:
+                    cached.update(self._fingerprint(abs_path, stat))
+                    self.store.put(cache_name, key, cached)
+
+            elif cached.get('hash') is not None:
+                file_hash = self._hash_file(abs_path)
+                if file_hash == cached['hash']:
+                    # same bytes. Store the new stat so that the cheap check is enough next time
+                    cached['mts'] = stat.st_mtime
+                    cached['size'] = stat.st_size
+                    self.store.put(cache_name, key, cached)
+                    is_fresh = True
+                    self._count(cache_name, key, 'hash_hits')
+
+        self._count(cache_name, key, 'hits' if is_fresh else 'misses')
+        return is_fresh, file_hash
+
+
+    def print_cache_stats(self):
+        logger.info('Wisdom cache:')
+        for cache_name, stats in sorted(self.cache_stats.items()):
+            total = stats['hits'] + stats['misses']
+            ratio = stats['hits'] / total * 100 if total else 0
+            logger.info(f"  {cache_name:<16} {stats['hits']:>7} hits ({stats['hash_hits']} by content hash) {stats['misses']:>7} misses {ratio:>6.1f}%, {stats['stale_deps']} invalidated by dependencies")
+
+
+    def detach(self):
+        self.detached = True
+        self._image_log = []
+        self.store.detach()
+
+
+    def pop_image_log(self):
+        image_log = self._image_log
+        self._image_log = []
+        return image_log
+
+
+    # Returns the compact meta record of a page: the fields of root.meta that the passes before rendering, sorting and
+    # filtering need. Records are kept in their own cache, separate from the render_cache, so none of that has to parse
+    # the page or unpickle its full root while the source is unchanged. Values are as declared in the source, plus a
+    # taxonomy's implied parent. Anything derived while rendering (i.e. titles of reviews, summaries) is only in the render info.
+    def get_meta(self, key_srp, is_taxonomy=False, stat=None):
+        abs_content_path = self.site_path / key_srp
+
+        if stat is None:
+            stat = abs_content_path.stat()
+
+        meta_cache = self.store.get('meta_cache', key_srp)
+        is_fresh, file_hash = self._check_fresh('meta_cache', key_srp, meta_cache, abs_content_path, stat)
+        if is_fresh and meta_cache['defs'] != self.get_defs_fingerprint():
+            self._count('meta_cache', key_srp, 'stale_deps')
+            is_fresh = False
+
+        if is_fresh:
+            return meta_cache['record']
+
+        rendered, root = self._parse_and_render(key_srp, is_taxonomy, meta_only=True)
+        meta = root.context['meta']
+
+        if is_taxonomy:
+            error = add_parent_taxonomy(meta)
+            if error:
+                raise Exception(f'{abs_content_path}: {error}')
+
+        record = {
+            'slug': meta.get('slug'),
+            'slug_path': meta.get('slug_path'), # taxonomies only
+            'pk': meta.get('pk'),
+            'date': meta.get('date'),
+            'taxonomy': meta.get('taxonomy', {}),
+            'title': meta.get('title'),
+            'gallery': meta.get('gallery'), # the gallery flag for taxonomies, the gallery context for content
+            'pseudo': meta.get('pseudo', False),
+            'use_template': meta.get('use_template'),
+            'manifest': meta.get('manifest', []) # site relative paths of files published next to the page
+        }
+
+        self.store.put('meta_cache', key_srp, {'record': record, 'defs': self.get_defs_fingerprint(), **self._fingerprint(abs_content_path, stat, file_hash)})
+
+        return record
+
+
+    def get_defs_fingerprint(self):
+        # changes whenever the indentgen version, the default tag defs or the site's custom indentgen_defs change,
+        # since any of those can change the rendered output of every page
+        if self._defs_fingerprint is None:
+            h = hashlib.blake2b(digest_size=16)
+
+            if version is not None:
+                try:
+                    h.update(version('indentgen').encode())
+                except PackageNotFoundError:
+                    pass
+
+            paths = sorted(Path(default_definitions.__file__).parent.glob('**/*.py'))
+            paths.append(Path(taxonomy_def_set.__file__))
+
+            defs_module = getattr(self.indentgen, 'defs_module', None)
+            defs_module_file = getattr(defs_module, '__file__', None)
+            if defs_module_file:
+                defs_module_path = Path(defs_module_file)
+                if defs_module_path.name == '__init__.py':
+                    paths.extend(sorted(defs_module_path.parent.glob('**/*.py')))
+                else:
+                    paths.append(defs_module_path)
+
+            for path in paths:
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+
+            self._defs_fingerprint = h.hexdigest()
+
+        return self._defs_fingerprint
+
+
+    # Called while a page is being rendered to record something its output depends on besides its own source.
+    # kind is 'pk_urls' (pk: resolved url) or 'images' (relative_path: (mtime, size) of the source image)
+    def add_dependency(self, kind, key, value):
+        if self._deps is not None:
+            self._deps[kind][key] = value
+
+
+    def _check_deps(self, deps):
+        if deps is None:
+            return False # rendered before dependencies were tracked
+
+        if deps['defs'] != self.get_defs_fingerprint():
+            return False
+
+        for pk, url in deps['pk_urls'].items():
+            try:
+                if self.indentgen.get_url_for_pk(pk) != url:
+                    return False
+            except KeyError:
+                return False # pk no longer exists
+
+        for tax_slug_path, gallery in deps['taxonomy_flags'].items():
+            tax_info = self.indentgen.taxonomy_map.get(tax_slug_path)
+            if (tax_info['gallery'] if tax_info else None) != gallery:
+                return False
+
+        # the urls of the embedded images depend on the image policy, their markup on the srcset options
+        if deps['images'] and (deps.get('image_policy') != self.image_policy or deps.get('image_srcset') != self.image_srcset):
+            return False
+
+        for relative_path, fingerprint in deps['images'].items():
+            try:
+                stat = (self.site_path / relative_path).stat()
+            except FileNotFoundError:
+                return False
+            if (stat.st_mtime, stat.st_size) != fingerprint:
+                return False
+
+        return True
+
+
+    def _check_render_fresh(self, key_srp, render_meta, abs_content_path, stat):
+        is_fresh, file_hash = self._check_fresh('render_cache', key_srp, render_meta, abs_content_path, stat)
+        # entries cached before the root was split out into the root_cache have no info
+        if is_fresh and ('info' not in render_meta or not self._check_deps(render_meta.get('deps'))):
+            self._count('render_cache', key_srp, 'stale_deps')
+            is_fresh = False
+        return is_fresh, file_hash
+
+
+    def is_render_fresh(self, key_srp, stat):
+        render_meta = self.store.get('render_cache', key_srp)
+        is_fresh, file_hash = self._check_render_fresh(key_srp, render_meta, self.site_path / key_srp, stat)
+        return is_fresh and (self.wisdom_path / key_srp).with_suffix('.html').exists()
+
+
+    # The bits of a rendered page that listings show. They're kept in the render_cache entry, apart from the root
+    # (see root_cache), so listing a page doesn't have to unpickle its whole root
+    @staticmethod
+    def make_render_info(root):
+        meta = root.context['meta']
+        return {
+            'title': meta.get('title', ''),
+            'description': meta.get('description', ''),
+            'summary': meta.get('summary_content', '') or ''.join(root.collectors.get('sum', []))
+        }
+
+
+    # Returns the render info of a page from the render_cache, or None if the page needs rendering
+    def get_render_info(self, key_srp, stat):
+        render_meta = self.store.get('render_cache', key_srp)
+        is_fresh, file_hash = self._check_render_fresh(key_srp, render_meta, self.site_path / key_srp, stat)
+        return render_meta['info'] if is_fresh else None
+
+
+    def merge_rendered(self, key_srp, render_meta, root, image_log):
+        # merge a page rendered by a detached worker. The image log is replayed in the order the worker
+        # touched the images so the result is the same as if the page had been rendered here
+        self.store.put('root_cache', key_srp, root)
+        self.store.put('render_cache', key_srp, render_meta)
+        self.rendered_srps.add(key_srp)
+        self.merge_image_log(image_log)
+
+
+    def merge_image_log(self, image_log):
+        for cache_key, img_data in image_log:
+            existing = self.store.get('img_cache', cache_key)
+            if existing:
+                if existing['copy_original'] != img_data['copy_original']:
+                    existing['copy_original'] = img_data['copy_original']
+                    self.store.put('img_cache', cache_key, existing)
+            else:
+                self.store.put('img_cache', cache_key, img_data)
+                self._index_image(cache_key, img_data)
+
+
+    def _index_image(self, cache_key, img_data):
+        if self._image_index is not None:
+            for serve_path in (img_data['serve_path'], img_data['original_serve_path']):
+                self._image_index.setdefault(serve_path, set()).add(cache_key)
+
+
+    def get_publish_manifest(self):
+        return dict(self.store.items('publish_cache')) or None
+
+
+    def set_publish_manifest(self, manifest):
+        self.store.replace_all('publish_cache', manifest)
+        self.save()
 
 
     def get_static_file_name(self, key_srp):
         abs_static_path = self.static_path / key_srp
-        mts = abs_static_path.stat().st_mtime
-        static_cache = self.data.get('static_cache')
-        if static_cache:
-            static_meta = static_cache.get(key_srp)
-            if static_meta:
-                if static_meta['mts'] == mts:
-                    return static_meta['srp']
-
-        static_cache = self.data.setdefault('static_cache', {})
+        stat = abs_static_path.stat()
+        static_meta = self.store.get('static_cache', key_srp)
+        is_fresh, file_hash = self._check_fresh('static_cache', key_srp, static_meta, abs_static_path, stat)
+        if is_fresh:
+            return static_meta['srp']
+
         renamed = f'{key_srp.stem}_{uuid4().hex}{key_srp.suffix}'
         new_srp = key_srp.with_name(renamed)
-        static_cache[key_srp] = {'mts': mts, 'srp': new_srp}
-        self.save()
+        self.store.put('static_cache', key_srp, {'srp': new_srp, **self._fingerprint(abs_static_path, stat, file_hash)})
         return new_srp
 
 
-    def get_rendered(self, key_srp, is_taxonomy = False, meta_only=False):
+    # stat can be passed in by callers that have already stat'd the source (i.e. the ContentIndex).
+    # load_body=False skips reading the cached .html on a cache hit and returns None in its place
+    def get_rendered(self, key_srp, is_taxonomy = False, meta_only=False, stat=None, load_body=True):
         abs_content_path = self.site_path / key_srp
         abs_cached_path = (self.wisdom_path / key_srp).with_suffix('.html')
 
-        mts = abs_content_path.stat().st_mtime
+        if stat is None:
+            stat = abs_content_path.stat()
+
+        file_hash = None
 
         if not meta_only:
-            render_cache = self.data.get('render_cache')
-            if render_cache:
-                render_meta = render_cache.get(key_srp)
-                if render_meta:
-                    if render_meta['mts'] == mts:
-                        try:
-                            with open(abs_cached_path, 'r') as f:
-                                root = render_meta['root']
-                                return f.read(), root
-                        except FileNotFoundError:
-                            # CACHED render result doesn't exist - re-render
-                            pass
+            render_meta = self.store.get('render_cache', key_srp)
+            is_fresh, file_hash = self._check_render_fresh(key_srp, render_meta, abs_content_path, stat)
+            root = self.store.get('root_cache', key_srp) if is_fresh else None
+            if root is not None:
+                if not load_body:
+                    return None, root
+                try:
+                    with open(abs_cached_path, 'r') as f:
+                        return f.read(), root
+                except FileNotFoundError:
+                    # CACHED render result doesn't exist - re-render
+                    pass
+
+        if meta_only:
+            return self._parse_and_render(key_srp, is_taxonomy, meta_only)
+
+        previous_deps = self._deps
+        self._deps = {'pk_urls': {}, 'images': {}}
+        try:
+            rendered, root = self._parse_and_render(key_srp, is_taxonomy, meta_only)
+            deps = self._deps
+        finally:
+            self._deps = previous_deps
+
+        deps['defs'] = self.get_defs_fingerprint()
+        deps['image_policy'] = self.image_policy
+        deps['image_srcset'] = self.image_srcset
+
+        # content pages read the gallery flag of each of their taxonomies in IndentgenContentRoot.before_render
+        deps['taxonomy_flags'] = {}
+        if not is_taxonomy:
+            for tax_slug_path in root.context['meta'].get('taxonomy', {}):
+                tax_info = self.indentgen.taxonomy_map.get(tax_slug_path)
+                deps['taxonomy_flags'][tax_slug_path] = tax_info['gallery'] if tax_info else None
+
+        abs_cached_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(abs_cached_path, 'w') as f:
+            f.write(rendered)
+
+        pickleable_root = PickleableTagDef(root.context, root.collectors)
+        self.store.put('root_cache', key_srp, pickleable_root)
+        self.store.put('render_cache', key_srp, {'info': self.make_render_info(root), 'deps': deps, **self._fingerprint(abs_content_path, stat, file_hash)})
+        self.rendered_srps.add(key_srp)
+
+        return rendered, root
+
+
+    def _parse_and_render(self, key_srp, is_taxonomy, meta_only):
+        abs_content_path = self.site_path / key_srp
 
         extra_context = {
             'srp': key_srp,
             'indentgen': self.indentgen
         }
 
+        profiler = self.indentgen.profiler
+        start = time.perf_counter()
+
         with open(abs_content_path, 'r') as f:
             try:
                 only_address = 'root.meta' if meta_only else None
@@ -97,33 +476,31 @@ class Wisdom:
         root.pre_render()
 
         if meta_only:
+            if profiler is not None:
+                profiler.add_source(key_srp, 'meta', time.perf_counter() - start)
             return '', root
 
+        parsed = time.perf_counter()
+
         try:
             rendered = root.render()
         except Exception as e:
             raise Exception(f'{abs_content_path}: {e}')
 
-        abs_cached_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(abs_cached_path, 'w') as f:
-            f.write(rendered)
-
-        render_cache = self.data.setdefault('render_cache', {})
-        pickleable_root = PickleableTagDef(root.context, root.collectors)
-        render_cache[key_srp] = {'mts': mts, 'root': pickleable_root}
+        if profiler is not None:
+            profiler.add_source(key_srp, 'parse', parsed - start)
+            profiler.add_source(key_srp, 'render', time.perf_counter() - parsed)
 
-        self.save()
         return rendered, root
 
 
     def get_config(self):
-        mts = self.config_file_path.stat().st_mtime
+        stat = self.config_file_path.stat()
 
-        config_cache = self.data.get('config_cache')
-        if config_cache:
-            config_mts = config_cache['mts']
-            if config_mts == mts:
-                return config_cache['data']
+        config_cache = self.store.get('config_cache', 'config')
+        is_fresh, file_hash = self._check_fresh('config_cache', 'config', config_cache, self.config_file_path, stat)
+        if is_fresh:
+            return config_cache['data']
 
         with open(self.config_file_path, 'r') as f:
             try:
@@ -131,24 +508,19 @@ class Wisdom:
             except Exception as e:
                 raise Exception(f'{self.config_file_path}: {e}')
 
-        self.data['config_cache'] = {'mts': mts, 'data': config_data}
-
-        self.save()
+        self.store.put('config_cache', 'config', {'data': config_data, **self._fingerprint(self.config_file_path, stat, file_hash)})
 
         return config_data
 
 
     def get_subsite_config(self, subsite_config_dir_srp):
         config_file_path = self.site_path / subsite_config_dir_srp / self.indentgen.CONFIG_FILE_NAME
-        mts = config_file_path.stat().st_mtime
+        stat = config_file_path.stat()
 
-        subsite_cache = self.data.get('subsite_cache')
-        if subsite_cache:
-            subsite_data = subsite_cache.get(subsite_config_dir_srp)
-            if subsite_data:
-                config_mts = subsite_data['mts']
-                if config_mts == mts:
-                    return subsite_data['data']
+        subsite_data = self.store.get('subsite_cache', subsite_config_dir_srp)
+        is_fresh, file_hash = self._check_fresh('subsite_cache', subsite_config_dir_srp, subsite_data, config_file_path, stat)
+        if is_fresh:
+            return subsite_data['data']
 
         with open(config_file_path, 'r') as f:
             try:
@@ -156,49 +528,122 @@ class Wisdom:
             except Exception as e:
                 raise Exception(f'{config_file_path}: {e}')
 
-        self.data.setdefault('subsite_cache', {})[subsite_config_dir_srp] = {'mts': mts, 'data': config_data}
-        self.save()
+        self.store.put('subsite_cache', subsite_config_dir_srp, {'data': config_data, **self._fingerprint(config_file_path, stat, file_hash)})
         return config_data
 
 
+    def set_image_policy(self, config):
+        image_format = config.get('image_format', self.DEFAULT_IMAGE_POLICY[0])
+
+        quality = None
+        if image_format != 'png': # quality only applies to the lossy formats
+            quality = int(config.get('image_quality', self.DEFAULT_IMAGE_QUALITY))
+            if not 1 <= quality <= 100:
+                raise Exception(f"{self.config_file_path}: image_quality must be between 1 and 100, got {quality}")
+
+        self.image_policy = (image_format, quality, bool(config.get('image_passthrough', False)))
+
+        srcset_widths = config.get('image_srcset_widths')
+        self.image_srcset = (tuple(srcset_widths), config.get('image_srcset_sizes')) if srcset_widths else None
+
+        # the img_cache only needs sweeping when the policy has changed since the last build
+        if self.store.get('config_cache', 'image_policy') == self.image_policy:
+            return
+
+        # Drop the cached versions made under a different policy. Their files are removed as well, otherwise a
+        # version with the same file name under the new policy would look fresh
+        for cache_key, img_data in self.store.items('img_cache'):
+            if len(cache_key) == 3:
+                # cached before the policy was part of the key
+                self.store.delete('img_cache', cache_key)
+                cache_key = (*cache_key, self.DEFAULT_IMAGE_POLICY)
+                img_data['image_format'] = 'PNG'
+                self.store.put('img_cache', cache_key, img_data)
+
+            if cache_key[3] != self.image_policy:
+                self.store.delete('img_cache', cache_key)
+                try:
+                    img_data['cached_path'].unlink()
+                except FileNotFoundError:
+                    pass
+
+        self.store.put('config_cache', 'image_policy', self.image_policy)
+        self.save()
+
+
+    def _get_image_format(self, relative_path):
+        suffix = relative_path.suffix.lower()
+
+        if suffix == '.gif':
+            return 'GIF' # always passed through, see resize_versions
+
+        image_format = self.image_policy[0]
+        if image_format == 'keep':
+            return self.KEEP_IMAGE_FORMATS.get(suffix, 'PNG')
+        return self.IMAGE_FORMATS[image_format]
+
+
     def _get_or_create_image_version(self, relative_path, max_width, max_height, copy_original, dentmark_srp):
 
-        cache_key = (relative_path, max_width, max_height)
+        cache_key = (relative_path, max_width, max_height, self.image_policy)
 
-        img_cache = self.data.get('img_cache')
-        if img_cache:
-            img_data = img_cache.get(cache_key)
-            if img_data:
+        img_data = self.store.get('img_cache', cache_key)
+        if img_data:
+            if img_data['copy_original'] != copy_original:
                 img_data['copy_original'] = copy_original
-                return relative_path, img_data['serve_path'], img_data['original_serve_path']
+                self.store.put('img_cache', cache_key, img_data)
+            if self._image_log is not None:
+                self._image_log.append((cache_key, img_data))
+            return relative_path, img_data['serve_path'], img_data['original_serve_path']
 
 
         full_path = self.site_path / relative_path
 
-        mts = full_path.stat().st_mtime
+        stat = full_path.stat()
 
         parent = relative_path.parent
 
         wisdom_save_dir = self.wisdom_path / self.IMAGE_CACHE_DIR / parent
         original_name_stem = full_path.stem
 
-        new_filename = f'{original_name_stem}_{max_width}_{max_height}.{self.CACHED_IMAGE_TYPE}'
+        image_format = self._get_image_format(relative_path)
+        image_format_name, quality, passthrough = self.image_policy
+
+        # With passthrough, a source that's already within the limit keeps its own format (and so its extension)
+        # whatever the configured one is, so resize_versions can copy it as is
+        source_format = self.KEEP_IMAGE_FORMATS.get(relative_path.suffix.lower())
+        if passthrough and source_format and image_format != 'GIF':
+            width, height = get_image_size(full_path)
+            if width <= max_width and height <= max_height:
+                image_format = source_format
+                quality = None
+
+        if image_format not in ('JPEG', 'WEBP'):
+            quality = None
+
+        # the quality is part of the name so that changing it changes the url, and browser caches pick up the new version
+        quality_suffix = f'_q{quality}' if quality else ''
+        new_filename = f'{original_name_stem}_{max_width}_{max_height}{quality_suffix}.{self.IMAGE_EXTENSIONS[image_format]}'
         cached_img_path = wisdom_save_dir / new_filename
         publish_path = (self.img_output_path / relative_path).with_name(new_filename)
         serve_path = ('/' + self.img_url) / publish_path.relative_to(self.img_output_path)
         original_publish_path = (self.img_output_path / relative_path)
         original_serve_path = ('/' + self.img_url) / original_publish_path.relative_to(self.img_output_path)
 
-        img_cache = self.data.setdefault('img_cache', {})
-
-        img_cache[cache_key] = {
-            'mts': mts,
+        # hash is set once the image has been resized
+        img_data = {
+            'mts': stat.st_mtime,
+            'size': stat.st_size,
+            'hash': None,
             'cached_path': cached_img_path,
             'publish_path': publish_path,
             'serve_path': serve_path,
             'original_path': full_path,
             'max_width': max_width,
             'max_height': max_height,
+            'image_format': image_format,
+            'quality': quality,
+            'passthrough': passthrough,
             'relative_path': relative_path,
             'copy_original': copy_original,
             'original_serve_path': original_serve_path,
@@ -209,14 +654,53 @@ class Wisdom:
         # then it's being called by a template and will have already been checked so it's safe to leave this out in that case,
         # since the template has no way of passing this value
         if dentmark_srp:
-            img_cache[cache_key]['dentmark_srp'] = dentmark_srp
+            img_data['dentmark_srp'] = dentmark_srp
 
-        self.save()
+        self.store.put('img_cache', cache_key, img_data)
+        self._index_image(cache_key, img_data)
+
+        if self._image_log is not None:
+            self._image_log.append((cache_key, img_data))
 
         return relative_path, serve_path, original_serve_path
 
 
     def get_image_url(self, dentmark_srp, image_relative_path, max_width, max_height, copy_original=False): # used by dentmark
+        relative = self._resolve_image_path(dentmark_srp, image_relative_path)
+        return self._get_or_create_image_version(relative, max_width, max_height, copy_original, dentmark_srp)
+
+
+    # Used by dentmark. Returns (width, height, srcset). width and height are the size of the max_width x max_height
+    # version (the one get_image_url returns), srcset is [(serve_path, width)] of the versions for each of widths that
+    # actually come out smaller than it. Each version's max height is scaled along with its width.
+    def get_image_srcset(self, dentmark_srp, image_relative_path, widths, max_width, max_height):
+        relative = self._resolve_image_path(dentmark_srp, image_relative_path)
+        source_size = get_image_size(self.site_path / relative)
+
+        width, height = self._get_version_size(relative, source_size, max_width, max_height)
+
+        srcset = []
+        for version_max_width in sorted(set(widths)):
+            version_max_height = max(1, round(max_height * version_max_width / max_width))
+            version_width, version_height = self._get_version_size(relative, source_size, version_max_width, version_max_height)
+
+            # skip versions that would be no smaller than the last one
+            if version_width >= width or (srcset and version_width <= srcset[-1][1]):
+                continue
+
+            serve_path = self._get_or_create_image_version(relative, version_max_width, version_max_height, False, dentmark_srp)[1]
+            srcset.append((serve_path, version_width))
+
+        return width, height, srcset
+
+
+    def _get_version_size(self, relative_path, source_size, max_width, max_height):
+        if self._get_image_format(relative_path) == 'GIF':
+            return source_size # gifs are copied, never resized
+        return get_resized_size(*source_size, max_width, max_height)
+
+
+    def _resolve_image_path(self, dentmark_srp, image_relative_path):
         parent = dentmark_srp.parent
         full_path = self.site_path / parent / image_relative_path
 
@@ -226,31 +710,161 @@ class Wisdom:
         except (ValueError, FileNotFoundError) as e:
             raise Exception(f"Invalid image url '{image_relative_path}'")
 
-        return self._get_or_create_image_version(relative, max_width, max_height, copy_original, dentmark_srp)
+        if self._deps is not None:
+            stat = resolved.stat()
+            self.add_dependency('images', relative, (stat.st_mtime, stat.st_size))
+
+        return relative
 
 
     def get_image_url_by_key(self, srp_key, max_width, max_height): # used by templates
         return self._get_or_create_image_version(srp_key, max_width, max_height, False, None)
 
 
-    def gen_cached_images(self, build=False):
-        for img_data in self.data.get('img_cache', {}).values():
-            if build:
-                original_path = img_data['original_path']
-                cached_path = img_data['cached_path']
+    # Used by the on demand server. Returns the file to serve for an image url, resizing it first if needed,
+    # or None if the url isn't a known image version
+    def get_image_file(self, serve_path):
+        if self._image_index is None:
+            self._image_index = {}
+            for cache_key, img_data in self.store.items('img_cache'):
+                self._index_image(cache_key, img_data)
 
-                # TODO will prob. error if original image no longer exists. Catch and handle better
-                try:
-                    mts = original_path.stat().st_mtime
-                except FileNotFoundError as e:
-                    #raise Exception(f"Error in {img_data['dentmark_srp']}: Image file not found: {img_data['relative_path']}")
-                    print(f"Stale Cached Image in Wisdom. No longer exists in content: {img_data['relative_path']}")
-                    continue
-
-                if mts != img_data['mts'] or not cached_path.exists():
-                    print(f"Resizing image to {img_data['max_width']}x{img_data['max_height']}: {original_path}")
-                    resize(original_path, cached_path, img_data['max_width'], img_data['max_height'])
-                    img_data['mts'] = mts
-                    self.save()
+        for cache_key in self._image_index.get(serve_path, ()):
+            img_data = self.store.get('img_cache', cache_key)
+            if img_data is None:
+                continue # dropped since it was indexed, i.e. by a policy change
+
+            if img_data['copy_original'] and img_data['original_serve_path'] == serve_path:
+                return img_data['original_path']
+
+            if img_data['serve_path'] != serve_path:
+                continue
+
+            original_path = img_data['original_path']
+            cached_path = img_data['cached_path']
+            stat = original_path.stat()
+
+            is_fresh = False
+            file_hash = None
+            if cached_path.exists():
+                is_fresh, file_hash = self._check_fresh('img_cache', cache_key, img_data, original_path, stat)
+
+            if not is_fresh:
+                resize_versions(original_path, [self._get_resize_version(img_data)])
+                img_data.update(self._fingerprint(original_path, stat, file_hash))
+                self.store.put('img_cache', cache_key, img_data)
+                self.save()
+
+            return cached_path
+
+        return None
+
+
+    def gen_cached_images(self, build=False, jobs=None):
+        if not build:
+            for cache_key, img_data in self.store.items('img_cache'):
+                yield img_data
+            return
+
+        stale = []
+        for cache_key, img_data in self.store.items('img_cache'):
+            original_path = img_data['original_path']
+            cached_path = img_data['cached_path']
+
+            # TODO will prob. error if original image no longer exists. Catch and handle better
+            try:
+                stat = original_path.stat()
+            except FileNotFoundError as e:
+                #raise Exception(f"Error in {img_data['dentmark_srp']}: Image file not found: {img_data['relative_path']}")
+                logger.warning(f"Stale Cached Image in Wisdom. No longer exists in content: {img_data['relative_path']}")
+                continue
+
+            is_fresh = False
+            file_hash = None
+            if cached_path.exists():
+                is_fresh, file_hash = self._check_fresh('img_cache', cache_key, img_data, original_path, stat)
+            else:
+                self._count('img_cache', cache_key, 'misses')
+
+            if is_fresh:
+                yield img_data
+            else:
+                stale.append((cache_key, img_data, stat, file_hash))
+
+        if not stale:
+            return
+
+        if jobs and not can_fork():
+            logger.warning("Resizing images serially: --jobs requires the 'fork' multiprocessing start method")
+            jobs = None
+
+        progress = Progress(logger, 'Resized', 'images', len(stale))
+        gen_resized = self._gen_resized_parallel(stale, jobs) if jobs else self._gen_resized_serial(stale)
+
+        for cache_key, img_data, stat, file_hash in gen_resized:
+            img_data.update(self._fingerprint(img_data['original_path'], stat, file_hash))
+            self.store.put('img_cache', cache_key, img_data)
+
+            logger.debug(f"Resized to {img_data['max_width']}x{img_data['max_height']}: {img_data['original_path']}")
+            progress.advance()
 
             yield img_data
+
+        progress.finish()
+
+        # commit the whole batch of resized images at once
+        self.save()
+
+
+    @staticmethod
+    def _get_resize_version(img_data):
+        # entries migrated from before the image policy was configurable have no format options and were always png
+        return (
+            img_data['cached_path'],
+            img_data['max_width'],
+            img_data['max_height'],
+            img_data.get('image_format', 'PNG'),
+            img_data.get('quality'),
+            img_data.get('passthrough', False)
+        )
+
+
+    @staticmethod
+    def _group_by_source(stale):
+        # all the stale versions of a source image are made together so it's only decoded once
+        groups = {}
+        for item in stale:
+            cache_key, img_data, stat, file_hash = item
+            groups.setdefault(img_data['original_path'], []).append(item)
+        return groups
+
+
+    def _gen_resized_serial(self, stale):
+        for original_path, items in self._group_by_source(stale).items():
+            resize_versions(original_path, [self._get_resize_version(item[1]) for item in items])
+            yield from items
+
+
+    def _gen_resized_parallel(self, stale, jobs):
+        # Yields the items of each source image as soon as its versions are done. Only a few sources per worker are
+        # queued at a time, so the number of decoded images held in memory stays bounded no matter how many are stale
+        max_pending = jobs * self.PENDING_RESIZES_PER_JOB
+        remaining = iter(self._group_by_source(stale).items())
+        pending = {}
+
+        with get_resize_pool(jobs) as pool:
+            while True:
+                for original_path, items in remaining:
+                    future = pool.submit(resize_versions, original_path, [self._get_resize_version(item[1]) for item in items])
+                    pending[future] = items
+                    if len(pending) >= max_pending:
+                        break
+
+                if not pending:
+                    break
+
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    items = pending.pop(future)
+                    future.result() # re-raise any error from the worker
+                    yield from items
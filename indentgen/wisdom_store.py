@@ -0,0 +1,101 @@
+import pickle
+import sqlite3
+
+
+class WisdomStore:
+    # sqlite backed key/value storage for Wisdom. Entries are grouped by cache name (render_cache, img_cache etc.)
+    # and each one is written on its own as it changes, rather than re-pickling everything on every cache miss.
+    # Writes are only committed when commit() is called, which happens at the end of each build phase.
+    #
+    # Keys are stored by their repr() so that Paths and tuples of Paths can be looked up directly. The
+    # original key is pickled along with the value so items() can hand it back.
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.detached = False
+        self._overlay = None
+        self._forked_conn = None
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = self._connect()
+        self.conn.execute('CREATE TABLE IF NOT EXISTS wisdom (cache TEXT NOT NULL, key TEXT NOT NULL, entry BLOB NOT NULL, PRIMARY KEY (cache, key))')
+        self.conn.commit()
+
+
+    def _connect(self):
+        # check_same_thread=False since the preview servers look things up from their request threads
+        return sqlite3.connect(str(self.db_path), check_same_thread=False)
+
+
+    def get(self, cache, key, default=None):
+        encoded_key = repr(key)
+
+        if self._overlay is not None and (cache, encoded_key) in self._overlay:
+            return self._overlay[(cache, encoded_key)][1]
+
+        row = self.conn.execute('SELECT entry FROM wisdom WHERE cache = ? AND key = ?', (cache, encoded_key)).fetchone()
+        if row is None:
+            return default
+        return pickle.loads(row[0])[1]
+
+
+    def put(self, cache, key, value):
+        encoded_key = repr(key)
+
+        if self.detached:
+            self._overlay[(cache, encoded_key)] = (key, value)
+            return
+
+        entry = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+        self.conn.execute('INSERT OR REPLACE INTO wisdom (cache, key, entry) VALUES (?, ?, ?)', (cache, encoded_key, entry))
+
+
+    def delete(self, cache, key):
+        if self.detached:
+            raise Exception('Cannot delete wisdom entries from a detached worker')
+
+        self.conn.execute('DELETE FROM wisdom WHERE cache = ? AND key = ?', (cache, repr(key)))
+
+
+    def items(self, cache):
+        # fetch everything up front, callers commonly put() while iterating
+        rows = self.conn.execute('SELECT key, entry FROM wisdom WHERE cache = ?', (cache,)).fetchall()
+
+        entries = {encoded_key: pickle.loads(entry) for encoded_key, entry in rows}
+
+        if self._overlay is not None:
+            for (overlay_cache, encoded_key), key_value in self._overlay.items():
+                if overlay_cache == cache:
+                    entries[encoded_key] = key_value
+
+        return list(entries.values())
+
+
+    def replace_all(self, cache, entries_dict):
+        if self.detached:
+            raise Exception('Cannot replace wisdom entries from a detached worker')
+
+        self.conn.execute('DELETE FROM wisdom WHERE cache = ?', (cache,))
+        self.conn.executemany(
+            'INSERT INTO wisdom (cache, key, entry) VALUES (?, ?, ?)',
+            ((cache, repr(key), pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)) for key, value in entries_dict.items())
+        )
+
+
+    def commit(self):
+        if not self.detached:
+            self.conn.commit()
+
+
+    def close(self):
+        self.conn.close()
+
+
+    def detach(self):
+        # Called in forked worker processes. A sqlite connection can't be used across a fork, so open a new one
+        # for reads and keep all writes in memory. The parent must commit before forking for the workers to see
+        # its changes. Keep a reference to the inherited connection so it's never closed from the child.
+        self._forked_conn = self.conn
+        self.conn = self._connect()
+        self.detached = True
+        self._overlay = {}
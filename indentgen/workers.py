@@ -0,0 +1,55 @@
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Worker processes are forked so they inherit the already built Indentgen instance (slug/pk/taxonomy maps,
+# the patched tag def sets and any custom indentgen_defs) without having to pickle any of it. Wisdom is
+# detached in the workers, so all cache changes are shipped back and merged by the parent process.
+
+_indentgen = None
+
+
+def can_fork():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def _init_worker(indentgen_inst):
+    global _indentgen
+    _indentgen = indentgen_inst
+    indentgen_inst.wisdom.detach()
+
+
+def get_process_pool(indentgen_inst, jobs):
+    # flush wisdom first so nothing that is pending in the parent is lost or duplicated by the forks
+    indentgen_inst.wisdom.save()
+    ctx = multiprocessing.get_context('fork')
+    return ProcessPoolExecutor(jobs, mp_context=ctx, initializer=_init_worker, initargs=(indentgen_inst,))
+
+
+def get_resize_pool(jobs):
+    # resizing only needs the paths and sizes that are passed to it, so these workers don't need the Indentgen instance
+    ctx = multiprocessing.get_context('fork')
+    return ProcessPoolExecutor(jobs, mp_context=ctx)
+
+
+def get_chunksize(num_items, jobs):
+    return max(1, num_items // (jobs * 4))
+
+
+def _pop_profile_log():
+    if _indentgen.profiler is None:
+        return None
+    return _indentgen.profiler.pop_worker_log()
+
+
+def render_page(srp, stat, is_taxonomy=False):
+    wisdom = _indentgen.wisdom
+    wisdom.get_rendered(srp, is_taxonomy, False, stat)
+    return srp, wisdom.store.get('render_cache', srp), wisdom.store.get('root_cache', srp), wisdom.pop_image_log(), _pop_profile_log()
+
+
+def render_route(url):
+    start = time.perf_counter()
+    rendered = _indentgen.routes[url].render()
+    elapsed = time.perf_counter() - start
+    return url, rendered, elapsed, _indentgen.wisdom.pop_image_log(), _pop_profile_log()
@@ -0,0 +1,25 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the synthetic site generator from the benchmarks doubles as the test fixture site
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'benchmarks'))
+
+from synthetic_site import SyntheticSite
+
+
+@pytest.fixture
+def site_path(tmp_path):
+    return SyntheticSite(
+        tmp_path / 'site',
+        pages=30,
+        taxonomy_depth=2,
+        taxonomy_breadth=2,
+        subsites=1,
+        subsite_pages=5,
+        galleries=1,
+        gallery_images=3,
+        per_page=5,
+        image_size=(64, 48)
+    ).generate()
@@ -0,0 +1,16 @@
+from indentgen import Indentgen
+from indentgen.endpoints import ContentGalleryEndpoint
+
+
+def test_gallery_images_found_from_any_working_directory(site_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    indentgen = Indentgen(site_path)
+    endpoints = [indentgen.routes[url] for url in indentgen.routes]
+    gallery_srps = [endpoint.srp for endpoint in endpoints if isinstance(endpoint, ContentGalleryEndpoint)]
+    indentgen.wisdom.close()
+
+    assert len(gallery_srps) == 3
+    for srp in gallery_srps:
+        assert not srp.is_absolute()
+        assert (site_path / srp).is_file()
@@ -0,0 +1,58 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from indentgen.wisdom import Wisdom
+
+
+@pytest.fixture
+def wisdom(tmp_path):
+    site_path = tmp_path.resolve()
+    indentgen_inst = SimpleNamespace(
+        site_path=site_path,
+        wisdom_path=site_path / '_wisdom',
+        content_path=site_path / 'content',
+        taxonomy_path=site_path / 'taxonomy',
+        static_path=site_path / 'static',
+        IMAGE_URL='img',
+        img_output_path=site_path / 'publish' / 'img',
+        config_file_path=site_path / 'config.dentmark'
+    )
+    (site_path / 'content').mkdir()
+    Image.new('RGB', (40, 30), 'red').save(site_path / 'content' / 'small.jpg')
+    Image.new('RGB', (400, 300), 'red').save(site_path / 'content' / 'large.jpg')
+
+    wisdom = Wisdom(indentgen_inst)
+    yield wisdom
+    wisdom.close()
+
+
+def get_serve_path(wisdom, image_name):
+    return wisdom.get_image_url(Path('content/page.dentmark'), image_name, 100, 100)[1]
+
+
+def test_quality_must_be_a_percentage(wisdom):
+    for quality in (0, 101):
+        with pytest.raises(Exception):
+            wisdom.set_image_policy({'image_format': 'webp', 'image_quality': quality})
+
+
+def test_cached_versions_only_dropped_when_policy_changes(wisdom):
+    wisdom.set_image_policy({'image_format': 'webp'})
+    get_serve_path(wisdom, 'large.jpg')
+    assert len(wisdom.store.items('img_cache')) == 1
+
+    wisdom.set_image_policy({'image_format': 'webp'})
+    assert len(wisdom.store.items('img_cache')) == 1
+
+    wisdom.set_image_policy({'image_format': 'png'})
+    assert not wisdom.store.items('img_cache')
+
+
+def test_passthrough_keeps_the_source_format_when_within_limit(wisdom):
+    wisdom.set_image_policy({'image_format': 'webp', 'image_passthrough': True})
+
+    assert get_serve_path(wisdom, 'small.jpg').suffix == '.jpg'
+    assert get_serve_path(wisdom, 'large.jpg').suffix == '.webp'
@@ -0,0 +1,34 @@
+import pytest
+from PIL import Image
+
+from indentgen.img_resize_utils import get_resized_size, get_image_size
+
+
+@pytest.mark.parametrize('size, max_size', [
+    ((400, 300), (100, 100)),
+    ((300, 400), (100, 100)),
+    ((1000, 10), (100, 100)),
+    ((10, 1000), (100, 100)),
+    ((1920, 1080), (800, 600)),
+    ((1080, 1920), (800, 600)),
+    ((333, 777), (123, 45)),
+    ((1001, 999), (500, 500)),
+    ((5000, 1), (640, 480)),
+])
+def test_resized_size_matches_thumbnail(size, max_size):
+    im = Image.new('RGB', size)
+    im.thumbnail(max_size)
+
+    assert get_resized_size(*size, *max_size) == im.size
+
+
+def test_images_within_the_limit_keep_their_size():
+    assert get_resized_size(64, 48, 64, 48) == (64, 48)
+    assert get_resized_size(10, 20, 800, 600) == (10, 20)
+
+
+def test_image_size_read_from_header(tmp_path):
+    path = tmp_path / 'image.png'
+    Image.new('RGB', (64, 48)).save(path)
+
+    assert get_image_size(path) == (64, 48)
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+from indentgen.path_dict import PathDict
+
+
+def test_get_finds_the_closest_containing_key():
+    path_dict = PathDict()
+    path_dict.add('content/sub', 'sub')
+    path_dict.add('content/sub/nested', 'nested')
+    path_dict.add(Path('content/other'), 'other')
+
+    assert path_dict.get('content/sub/page.dentmark') == 'sub'
+    assert path_dict.get('content/sub/nested/deeper/page.dentmark') == 'nested'
+    assert path_dict.get(Path('content/other/page.dentmark')) == 'other'
+    assert path_dict.get('content/subsite/page.dentmark') is None # a component has to match, not just a prefix
+    assert path_dict.get('content/page.dentmark') is None
+
+
+def test_add_replaces_existing_data():
+    path_dict = PathDict()
+    path_dict.add('content/sub', 'old')
+    path_dict.add('content/sub', 'new')
+
+    assert path_dict.get('content/sub/page.dentmark') == 'new'
+    assert list(path_dict) == ['new']
+
+
+def test_iterates_shallowest_first_then_most_recently_added():
+    path_dict = PathDict()
+    path_dict.add('content/a/b', 'a/b')
+    path_dict.add('content/a', 'a')
+    path_dict.add('content/c', 'c')
+
+    assert list(path_dict) == ['c', 'a', 'a/b']
@@ -0,0 +1,97 @@
+import gzip
+
+import pytest
+
+from indentgen.publisher import Publisher
+
+
+def publish(output_path, manifest, pages, incremental=True, precompress=True):
+    publisher = Publisher(output_path, manifest, incremental, precompress=precompress)
+    publisher.begin()
+    for name, text in pages.items():
+        publisher.write_text(output_path / name, text)
+    return publisher, publisher.finish()
+
+
+def test_precompressed_variants_written_next_to_text_files(tmp_path):
+    text = 'lorem ipsum ' * 100
+    publisher, manifest = publish(tmp_path, None, {'index.html': text, 'small.html': 'tiny', 'data.bin': text})
+
+    assert gzip.decompress((tmp_path / 'index.html.gz').read_bytes()).decode() == text
+    assert '.gz' in manifest['index.html']['variants']
+    assert not manifest['small.html']['variants'] # not worth compressing
+    assert not manifest['data.bin']['variants']
+    assert not (tmp_path / 'data.bin.gz').exists()
+
+
+def test_precompressed_variants_follow_their_file(tmp_path):
+    text = 'lorem ipsum ' * 100
+    publisher, manifest = publish(tmp_path, None, {'index.html': text, 'old.html': text})
+
+    publisher, manifest = publish(tmp_path, manifest, {'index.html': text + 'changed'})
+    assert gzip.decompress((tmp_path / 'index.html.gz').read_bytes()).decode() == text + 'changed'
+    assert not (tmp_path / 'old.html').exists()
+    assert not (tmp_path / 'old.html.gz').exists()
+
+    publisher, manifest = publish(tmp_path, manifest, {'index.html': text + 'changed'}, precompress=False)
+    assert publisher.num_unchanged == 1
+    assert not (tmp_path / 'index.html.gz').exists()
+    assert manifest['index.html']['variants'] == []
+
+
+def test_incremental_only_rewrites_changed_files(tmp_path):
+    publisher, manifest = publish(tmp_path, None, {'a.html': 'a', 'b.html': 'b'}, precompress=False)
+    mtime_a = (tmp_path / 'a.html').stat().st_mtime_ns
+
+    publisher, manifest = publish(tmp_path, manifest, {'a.html': 'a', 'b.html': 'b changed'}, precompress=False)
+
+    assert (publisher.num_written, publisher.num_unchanged, publisher.num_removed) == (1, 1, 0)
+    assert (tmp_path / 'a.html').stat().st_mtime_ns == mtime_a
+    assert (tmp_path / 'b.html').read_text() == 'b changed'
+    assert manifest['b.html']['hash'] == Publisher.get_hash(b'b changed')
+
+
+def test_incremental_removes_files_no_longer_published(tmp_path):
+    publisher, manifest = publish(tmp_path, None, {'a.html': 'a', 'old/index.html': 'old'}, precompress=False)
+
+    publisher, manifest = publish(tmp_path, manifest, {'a.html': 'a'}, precompress=False)
+
+    assert publisher.num_removed == 1
+    assert not (tmp_path / 'old').exists() # emptied directories are pruned
+    assert set(manifest) == {'a.html'}
+
+
+def test_incremental_rewrites_missing_output(tmp_path):
+    publisher, manifest = publish(tmp_path, None, {'a.html': 'a'}, precompress=False)
+    (tmp_path / 'a.html').unlink()
+
+    publisher, manifest = publish(tmp_path, manifest, {'a.html': 'a'}, precompress=False)
+
+    assert publisher.num_written == 1
+    assert (tmp_path / 'a.html').read_text() == 'a'
+
+
+def test_full_publish_wipes_the_output(tmp_path):
+    publisher, manifest = publish(tmp_path / 'out', None, {'a.html': 'a'}, precompress=False)
+    (tmp_path / 'out' / 'stray.txt').write_text('stray')
+
+    publisher, manifest = publish(tmp_path / 'out', manifest, {'a.html': 'a'}, incremental=False, precompress=False)
+
+    assert publisher.num_written == 1
+    assert not (tmp_path / 'out' / 'stray.txt').exists()
+
+
+def test_copy_skips_hashing_untouched_sources(tmp_path, monkeypatch):
+    source = tmp_path / 'src.css'
+    source.write_text('body {}')
+    output_path = tmp_path / 'out'
+
+    publisher = Publisher(output_path, None)
+    publisher.copy_file(source, output_path / 'site.css')
+    manifest = publisher.finish()
+
+    publisher = Publisher(output_path, manifest, incremental=True)
+    monkeypatch.setattr(Publisher, 'get_hash', staticmethod(lambda data: pytest.fail('hashed an untouched source')))
+    publisher.copy_file(source, output_path / 'site.css')
+
+    assert publisher.num_unchanged == 1
@@ -0,0 +1,23 @@
+from indentgen import Indentgen
+
+
+def test_listing_a_cached_page_does_not_load_its_root(site_path):
+    Indentgen(site_path).generate()
+
+    indentgen = Indentgen(site_path)
+    taxonomy_endpoint = next(tax_info['endpoint'] for tax_info in indentgen.taxonomy_map.values() if tax_info['endpoint'].child_pages)
+    listed = list(taxonomy_endpoint.paginator_page.items)
+    taxonomy_endpoint.render()
+
+    for endpoint in listed:
+        assert endpoint.title
+        assert indentgen.content_index.records[endpoint.srp]['root'] is None
+    indentgen.wisdom.close()
+
+
+def test_render_info_matches_the_rendered_page(site_path):
+    indentgen = Indentgen(site_path)
+    for record in indentgen.content_index.gen_records():
+        root = indentgen.content_index.get_root(record['srp'])
+        assert indentgen.content_index.get_info(record['srp']) == indentgen.wisdom.make_render_info(root)
+    indentgen.wisdom.close()
@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+from indentgen.endpoints import Endpoint, RedirectEndpoint, StaticServeEndpoint, CachedImgEndpoint
+from indentgen.route_table import RouteTable
+
+
+@pytest.fixture
+def routes():
+    return RouteTable(SimpleNamespace())
+
+
+def add_listing(routes, url_components, num_items, per_page):
+    base_endpoint = Endpoint(routes.indentgen, url_components, 0)
+    base_endpoint.child_pages = list(range(num_items))
+    return routes.add_paginated(base_endpoint, per_page)
+
+
+def test_paginated_urls_enumerated_without_making_pages(routes):
+    paginated = add_listing(routes, ['tags', 'x'], 12, 5)
+
+    assert list(routes) == ['/tags/x/page/1/', '/tags/x/page/', '/tags/x/', '/tags/x/page/2/', '/tags/x/page/3/']
+    assert len(routes) == 5
+    assert list(paginated.paginator._endpoint_objs) == [0] # only the base page
+
+
+def test_empty_listing_still_has_a_first_page(routes):
+    add_listing(routes, ['tags', 'empty'], 0, 5)
+
+    assert list(routes) == ['/tags/empty/page/1/', '/tags/empty/page/', '/tags/empty/']
+
+
+def test_paginated_lookups(routes):
+    paginated = add_listing(routes, ['tags', 'x'], 12, 5)
+
+    assert routes['/tags/x/'] is paginated.base_endpoint
+    assert routes['/tags/x/page/3/'].page == 2
+    assert routes['/tags/x/page/3/'].paginator_page.items == [10, 11]
+
+    for url in ('/tags/x/page/1/', '/tags/x/page/'):
+        redirect = routes[url]
+        assert isinstance(redirect, RedirectEndpoint)
+        assert redirect.to_endpoint is paginated.base_endpoint
+
+    for url in ('/tags/x/page/4/', '/tags/x/page/0/', '/tags/x/page/02/', '/tags/x/page/two/', '/tags/y/page/2/'):
+        assert url not in routes
+
+
+def test_static_routes_made_when_looked_up(routes):
+    routes.add(Endpoint(routes.indentgen, ['about']))
+    routes.add_static(StaticServeEndpoint, ['_static', 'site.css'])
+    routes.add_static(CachedImgEndpoint, ['_img', 'photo.png'])
+
+    assert isinstance(routes['/_static/site.css/'], StaticServeEndpoint)
+    assert routes['/_static/site.css/'] is not routes['/_static/site.css/']
+    assert isinstance(routes['/_img/photo.png/'], CachedImgEndpoint)
+    assert list(routes.gen_urls_excluding(StaticServeEndpoint)) == ['/about/']
+    assert list(routes.gen_urls_excluding(CachedImgEndpoint)) == ['/about/', '/_static/site.css/']
+
+
+def test_collisions_raise(routes):
+    add_listing(routes, ['tags', 'x'], 12, 5)
+
+    with pytest.raises(Exception):
+        routes.add(Endpoint(routes.indentgen, ['tags', 'x', 'page', '2']))
+    with pytest.raises(Exception):
+        routes.add(Endpoint(routes.indentgen, ['tags', 'x']))
+    with pytest.raises(Exception):
+        add_listing(routes, ['tags', 'x'], 3, 5)
@@ -0,0 +1,76 @@
+import os
+
+from indentgen import Indentgen
+
+
+def build(site_path, jobs=None, incremental=False):
+    indentgen = Indentgen(site_path, jobs)
+    indentgen.generate(incremental)
+    indentgen.wisdom.close()
+    return indentgen
+
+
+def get_body_mtimes(site_path):
+    # the cached page bodies, rewritten whenever a page is rendered (including by worker processes)
+    wisdom_path = site_path / Indentgen.WISDOM_DIR
+    return {path: path.stat().st_mtime_ns for path in wisdom_path.glob('**/*.html')}
+
+
+def test_warm_build_hits_every_cache(site_path):
+    build(site_path)
+    indentgen = build(site_path)
+
+    stats = indentgen.wisdom.cache_stats
+    for cache_name in ('meta_cache', 'render_cache', 'config_cache'):
+        assert stats[cache_name]['misses'] == 0, cache_name
+        assert stats[cache_name]['hits'] > 0, cache_name
+    assert not indentgen.wisdom.rendered_srps
+
+
+def test_warm_parallel_build_renders_nothing(site_path):
+    build(site_path, jobs=2)
+    body_mtimes = get_body_mtimes(site_path)
+    assert body_mtimes
+
+    indentgen = build(site_path, jobs=2)
+
+    assert not indentgen.wisdom.rendered_srps
+    assert get_body_mtimes(site_path) == body_mtimes
+
+
+def test_parallel_build_caches_taxonomy_bodies(site_path):
+    # taxonomy bodies are rendered lazily while their routes render, which happens in detached workers with --jobs
+    build(site_path, jobs=2)
+
+    indentgen = Indentgen(site_path)
+    for record in indentgen.content_index.gen_records(is_taxonomy=True):
+        assert indentgen.wisdom.is_render_fresh(record['srp'], record['stat']), record['srp']
+    indentgen.wisdom.close()
+
+
+def test_parallel_build_publishes_the_same_files(site_path, tmp_path):
+    build(site_path)
+    output_path = site_path / Indentgen.OUTPUT_DIR
+    serial = {path.relative_to(output_path): path.read_bytes() for path in output_path.glob('**/*') if path.is_file()}
+
+    build(site_path, jobs=2)
+    parallel = {path.relative_to(output_path): path.read_bytes() for path in output_path.glob('**/*') if path.is_file()}
+
+    assert parallel == serial
+
+
+def test_touched_sources_hit_by_content_hash(site_path):
+    build(site_path)
+
+    # as a git checkout or CI clone would
+    for path in site_path.glob('**/*.dentmark'):
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    indentgen = build(site_path)
+
+    stats = indentgen.wisdom.cache_stats
+    assert stats['render_cache']['misses'] == 0
+    assert stats['render_cache']['hash_hits'] > 0
+    assert stats['meta_cache']['misses'] == 0
+    assert not indentgen.wisdom.rendered_srps
@@ -0,0 +1,78 @@
+import os
+import sys
+from types import SimpleNamespace
+
+from indentgen import Indentgen
+from indentgen.watcher import Watcher
+
+
+def make_watcher(site_path):
+    indentgen_inst = SimpleNamespace(
+        site_path=site_path,
+        config_file_path=site_path / 'config.dentmark',
+        content_path=site_path / 'content',
+        taxonomy_path=site_path / 'taxonomy',
+        THEME_DIR='theme',
+        CUSTOM_DEFS_MODULE_NAME='indentgen_defs'
+    )
+    return Watcher(indentgen_inst)
+
+
+def test_snapshot_finds_changed_added_and_removed_files(tmp_path):
+    (tmp_path / 'content' / 'pages').mkdir(parents=True)
+    page = tmp_path / 'content' / 'pages' / 'page.dentmark'
+    page.write_text('p: one')
+    (tmp_path / 'config.dentmark').write_text('title: site')
+    watcher = make_watcher(tmp_path)
+    assert set(watcher.snapshot) == {page, tmp_path / 'config.dentmark'}
+
+    page.write_text('p: one two')
+    added = tmp_path / 'content' / 'new' / 'added.dentmark'
+    added.parent.mkdir()
+    added.write_text('p: added')
+    snapshot = watcher._take_snapshot()
+    assert snapshot[page] != watcher.snapshot[page]
+    assert added in snapshot
+
+    os.remove(added)
+    assert added not in watcher._take_snapshot()
+
+
+def test_snapshot_only_lists_changed_directories(tmp_path, monkeypatch):
+    (tmp_path / 'content' / 'a').mkdir(parents=True)
+    (tmp_path / 'content' / 'a' / 'page.dentmark').write_text('p: one')
+    watcher = make_watcher(tmp_path)
+
+    listed = []
+    list_dir = watcher._list_dir
+    monkeypatch.setattr(watcher, '_list_dir', lambda dir_path, mtime: listed.append(dir_path) or list_dir(dir_path, mtime))
+
+    watcher._take_snapshot()
+    assert not listed
+
+    (tmp_path / 'content' / 'a' / 'other.dentmark').write_text('p: two')
+    os.utime(tmp_path / 'content' / 'a', ns=(1, 1)) # make sure the mtime changes, whatever its resolution
+    watcher._take_snapshot()
+    assert listed == [tmp_path / 'content' / 'a']
+
+
+def test_content_change_refreshes_in_place(site_path):
+    indentgen = Indentgen(site_path)
+    indentgen.generate()
+    wisdom = indentgen.wisdom
+
+    page = site_path / 'content' / 'pages' / 'page-3.dentmark'
+    with open(page, 'a') as f:
+        f.write('p:\n    a freshly added paragraph\n')
+
+    watcher = Watcher(indentgen)
+    watcher.rebuild({page})
+
+    assert watcher.indentgen is indentgen
+    assert indentgen.wisdom is wisdom
+    assert sys.path.count(str(site_path)) == 1
+    assert page.relative_to(site_path) in wisdom.rendered_srps
+
+    output_path = site_path / Indentgen.OUTPUT_DIR
+    assert any('a freshly added paragraph' in path.read_text() for path in output_path.glob('**/index.html'))
+    wisdom.close()
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import pytest
+
+from indentgen.wisdom_store import WisdomStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = WisdomStore(tmp_path / '_wisdom' / 'wisdom.sqlite3')
+    yield store
+    store.close()
+
+
+def test_path_and_tuple_keys(store):
+    store.put('render_cache', Path('content/a.dentmark'), {'mts': 1})
+    store.put('img_cache', (Path('content/a.png'), 100, 100, ('png', None, False)), {'serve_path': 'x'})
+
+    assert store.get('render_cache', Path('content/a.dentmark')) == {'mts': 1}
+    assert store.get('render_cache', Path('content/b.dentmark')) is None
+    assert store.get('render_cache', Path('content/b.dentmark'), 'default') == 'default'
+    assert store.items('img_cache') == [((Path('content/a.png'), 100, 100, ('png', None, False)), {'serve_path': 'x'})]
+
+
+def test_only_committed_entries_persist(tmp_path, store):
+    store.put('render_cache', 'committed', 1)
+    store.commit()
+    store.put('render_cache', 'uncommitted', 2)
+    store.close()
+
+    reopened = WisdomStore(tmp_path / '_wisdom' / 'wisdom.sqlite3')
+    assert reopened.get('render_cache', 'committed') == 1
+    assert reopened.get('render_cache', 'uncommitted') is None
+    reopened.close()
+
+
+def test_delete_and_replace_all(store):
+    store.put('meta_cache', 'a', 1)
+    store.put('meta_cache', 'b', 2)
+    store.put('render_cache', 'a', 3)
+
+    store.delete('meta_cache', 'a')
+    assert store.get('meta_cache', 'a') is None
+
+    store.replace_all('meta_cache', {'c': 4})
+    assert store.items('meta_cache') == [('c', 4)]
+    assert store.get('render_cache', 'a') == 3
+
+
+def test_detached_writes_stay_in_the_overlay(tmp_path, store):
+    store.put('render_cache', 'a', 1)
+    store.put('render_cache', 'b', 2)
+    store.commit()
+
+    store.detach()
+    store.put('render_cache', 'b', 'overlaid')
+    store.put('render_cache', 'c', 3)
+    store.commit() # a no-op once detached
+
+    assert store.get('render_cache', 'a') == 1
+    assert store.get('render_cache', 'b') == 'overlaid'
+    assert sorted(store.items('render_cache')) == [('a', 1), ('b', 'overlaid'), ('c', 3)]
+
+    with pytest.raises(Exception):
+        store.delete('render_cache', 'a')
+    with pytest.raises(Exception):
+        store.replace_all('render_cache', {})
+
+    reopened = WisdomStore(tmp_path / '_wisdom' / 'wisdom.sqlite3')
+    assert sorted(reopened.items('render_cache')) == [('a', 1), ('b', 2)]
+    reopened.close()